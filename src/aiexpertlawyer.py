@@ -3,12 +3,31 @@
 # Auteur : Xavier BEDNAREK
 # Date : 10/09/2025
 
-from mytools import setup_env_variables, create_file_if_not_exists
+from mytools import setup_env_variables, create_file_if_not_exists, fingerprint, normalize_question
+from context_builder import ContextBuilder
+from hierarchical_index import HierarchicalRetriever, chapter_collection_name
+from references import ReferenceGraph, references_path
+from local_index import LocalVectorIndex, local_index_path
+import os
 from langchain_chroma import Chroma
 import datetime
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import GoogleGenerativeAI
+from langchain_core.runnables import Runnable
+from embeddings import make_embeddings, collection_dimension, check_dimension
+from provider import get_provider, get_llm
+from sessions import Session
+from prompt_cache import make_prompt_cache
+from reranker import Reranker
+from metadata_index import MetadataIndex, Scope
+from prefetch import PrefetchCache
+from prompt_registry import PromptTemplate, compile_prompt
+import copy
+import json
+import threading
 from langchain_core.documents import Document
+from typing import Iterator
+
+# Variables du prompt système de l'expert (toutes deux obligatoires)
+EXPERT_PROMPT_FIELDS = ("rag_data", "user_prompt")
 
 class AIExpertLawyer() : 
     """Classe définissant un Agent IA expert en droit penal
@@ -18,7 +37,7 @@ class AIExpertLawyer() :
     #                                                               Constructeur
     # --------------------------------------------------------------------------
 
-    def __init__(self, *, system_prompt: str| None = None, chroma_collection_name: str = "code_penal", chroma_db_path : str = "./chroma_langchain_db", llm_model : str = "gemini-2.5-flash-lite", temperature : float = 0.3, top_p: float = 0.8, nb_chunk : int = 4, logfile : str|None = "logs/log_AIExpertLawyer.txt") -> None:
+    def __init__(self, *, system_prompt: str| None = None, chroma_collection_name: str = "code_penal", chroma_db_path : str = "./chroma_langchain_db", llm_model : str = "gemini-2.5-flash-lite", temperature : float = 0.3, top_p: float = 0.8, nb_chunk : int = 4, embedding_dimension : int|None = None, embeddings_cache : str|None = None, local_index : bool = False, coarse_dim : int|None = None, hierarchical : bool = False, nb_chapitres : int = 5, inject_chapter_context : bool = False, expand_references : bool = False, reference_token_budget : int = 600, rerank : str|None = None, rerank_factor : int = 4, context_token_budget : int|None = 2000, prompt_cache : str = "local", prefetch_ttl : float = 60.0, logfile : str|None = "logs/log_AIExpertLawyer.txt") -> None:
         """Constructeur de l'Agent IA"""
 
         # Setup des variables d'environnement
@@ -26,7 +45,17 @@ class AIExpertLawyer() :
 
         # 1 - Paramétrage de la base de donnée sémantique (Chroma)
 
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+        # Les vecteurs peuvent être tronqués à embedding_dimension composantes (cf. embeddings.py).
+        # Par défaut (None), c'est la dimension des vecteurs de la collection (par ex. une
+        # collection tronquée par truncate_collection.py) ; une valeur précisée doit lui correspondre.
+        stored_dimension = collection_dimension(Chroma(collection_name=chroma_collection_name, persist_directory=chroma_db_path))
+        if embedding_dimension is None :
+            embedding_dimension = stored_dimension
+        else :
+            check_dimension(stored_dimension, embedding_dimension, f"La collection '{chroma_collection_name}'")
+        # embeddings_cache : fichier de cache des vecteurs des questions (utile pour les benchmarks)
+        embeddings = make_embeddings(embedding_dimension, cache_path=embeddings_cache)
+        self._embeddings = embeddings
 
         self._vector_store = Chroma(
             collection_name=chroma_collection_name,
@@ -35,10 +64,11 @@ class AIExpertLawyer() :
         )
 
         # 2 - Paramétrage du LLM
-        self._llm = GoogleGenerativeAI(model=llm_model, 
-                                       temperature=temperature,  # Entre 0.0 et 1.0
-                                       top_p=top_p               # Entre 0.0 et 1.0
-                                       )
+        self._llm_model = llm_model
+        self._temperature = temperature
+        self._top_p = top_p
+        self._llm = self._make_llm(llm_model)
+        self._other_llms : dict[str, Runnable] = {} # Autres modèles (cf. generate)
 
         # 3 - Meta prompt utilisé :
         if not system_prompt : # On fait un prompt par défaut
@@ -47,15 +77,70 @@ class AIExpertLawyer() :
                                    "<user prompt>:\n{user_prompt}\n")
         else :
             self._system_prompt = system_prompt
+        # Modèle validé une fois pour toutes (lève une InvalidPromptError avant toute requête API s'il est inutilisable)
+        self._prompt = compile_prompt(self._system_prompt, required=EXPERT_PROMPT_FIELDS)
+        # Le début du prompt système (avant {rag_data}) est le même à chaque appel : il
+        # peut être gardé en cache chez le fournisseur ("gemini", cf. prompt_cache.py)
+        self._prompt_cache = make_prompt_cache(self._system_prompt, prompt_cache)
 
         # 4 - Paramétrage de la façon dont sont faites les requêtes dans la base de donnée sémantique
         self._nb_chunks = nb_chunk
+        # Recherche dans l'index local (compact, cf. build_local_index.py) plutôt que dans Chroma
+        self._local_index = None
+        if local_index :
+            index_path = local_index_path(chroma_db_path, chroma_collection_name)
+            if os.path.exists(index_path) :
+                # coarse_dim : on ne parcourt que les premières composantes, avant de re-classer en pleine dimension
+                self._local_index = LocalVectorIndex.load(index_path, coarse_dim=coarse_dim)
+                check_dimension(self._local_index.dimension(), embedding_dimension, f"L'index local '{index_path}'")
+            else :
+                print(f"⚠️  Index local introuvable ({index_path}, cf. build_local_index.py) : on cherche dans Chroma.")
+        # Recherche hiérarchique (chapitres puis articles), si l'index des chapitres existe
+        self._hierarchical_retriever = None
+        self._inject_chapter_context = inject_chapter_context
+        if hierarchical :
+            chapter_store = Chroma(
+                collection_name=chapter_collection_name(chroma_collection_name),
+                embedding_function=embeddings,
+                persist_directory=chroma_db_path,
+            )
+            self._hierarchical_retriever = HierarchicalRetriever(article_store=self._vector_store, chapter_store=chapter_store,
+                                                                 embeddings=embeddings, nb_chapitres=nb_chapitres)
+            if not self._hierarchical_retriever.is_available() :
+                print("⚠️  Index des chapitres vide (cf. build_hierarchy.py) : on fait une recherche à plat.")
+                self._hierarchical_retriever = None
+        # Ajout des articles cités par les résultats (graphe des renvois construit à l'ingestion)
+        self._reference_graph = None
+        self._reference_token_budget = reference_token_budget
+        if expand_references :
+            graph_path = references_path(chroma_db_path, chroma_collection_name)
+            if os.path.exists(graph_path) :
+                self._reference_graph = ReferenceGraph.load(graph_path)
+            else :
+                print(f"⚠️  Graphe des renvois introuvable ({graph_path}, cf. build_references.py) : pas d'ajout des articles cités.")
+
+        # Re-classement des candidats (rerank_factor fois plus que nb_chunk) avant de garder les nb_chunk meilleurs (cf. reranker.py)
+        self._reranker = Reranker.from_name(rerank) if rerank else None
+        self._rerank_factor = rerank_factor
+
+        # Index des métadonnées (bitmaps), construit à la 1ère recherche avec une portée (cf. metadata_index.py)
+        self._metadata_index : MetadataIndex|None = None
+        self._metadata_index_lock = threading.Lock()
+
+        # Recherches faites à l'avance pendant que l'utilisateur tape sa question (cf. prefetch), gardées prefetch_ttl secondes
+        self._prefetch_ttl = prefetch_ttl
+        self._prefetched = PrefetchCache(ttl=prefetch_ttl)
 
-        # 5 - Gestion des logs
+        # 5 - Construction du contexte (<rag data>) à partir des chunks
+        self._context_token_budget = context_token_budget
+        self._context_builder = ContextBuilder(token_budget=context_token_budget)
+        self._last_context_stats : dict = {}
+
+        # 6 - Gestion des logs
         self._logfile = logfile
         if self._logfile  is not None :
             create_file_if_not_exists(self._logfile)
-        self.log("="*80 + "\n ! ! CREATING NEW AIExpertLawyer ! ! ")
+        self.log("="*80 + "\n ! ! CREATING NEW AIExpertLawyer ! ! " + f"(prompt {self._prompt.version}, {self._prompt.tokens} tokens)")
 
     # --------------------------------------------------------------------------
     #                                                                   Méthodes
@@ -68,6 +153,12 @@ class AIExpertLawyer() :
         f"   - system_prompt :\n     ---------------\n     {self._system_prompt.strip().replace("\n","\n     ")}\n     ---------------\n" +
         f"   - llm :\n     {str(self._llm).replace("\n","\n     ")}\n" + 
         f"   - nb_chunks : {self._nb_chunks}\n" + 
+        f"   - local_index : {self._local_index is not None}\n" + 
+        f"   - hierarchical : {self._hierarchical_retriever is not None}\n" + 
+        f"   - expand_references : {self._reference_graph is not None}\n" + 
+        f"   - rerank : {self._reranker._scorer.name if self._reranker is not None else None}\n" + 
+        f"   - context_token_budget : {self._context_token_budget}\n" + 
+        f"   - prompt_cache : {type(self._prompt_cache).__name__} (préfixe de {self._prompt_cache.prefix_tokens} tokens)\n" + 
         "=========================================="   
         )
     
@@ -79,25 +170,282 @@ class AIExpertLawyer() :
     
     def get_system_prompt(self) -> str :
         return self._system_prompt
+
+    def get_prompt_template(self) -> PromptTemplate :
+        """Modèle du prompt système validé (version = empreinte de son contenu, taille en tokens)"""
+        return self._prompt
     
-    def ask(self, question:str) -> str:
-        """Demande quelque chose à notre agent"""
+    def get_last_context_stats(self) -> dict :
+        """Statistiques du dernier contexte construit (tokens, économie par rapport au format brut, ...)"""
+        return self._last_context_stats
+
+    def index_version(self) -> str :
+        """Identifiant de l'état de la base sémantique (change si la collection est recréée ou change de taille)"""
+        collection = self._vector_store._collection
+        return f"{collection.name}:{collection.id}:{collection.count()}"
+
+    def prompt_version(self) -> str :
+        """Empreinte de tout ce qui, à base sémantique égale, détermine les réponses (prompt, modèle, recherche)"""
+        return fingerprint(self._prompt.version, self._llm_model, self._temperature, self._top_p, self._nb_chunks,
+                           self._context_token_budget, self._local_index is not None, self._hierarchical_retriever is not None,
+                           self._inject_chapter_context, self._reference_graph is not None,
+                           self._reranker._scorer.name if self._reranker is not None else None, self._rerank_factor)
+
+    def answer_versions(self) -> dict[str, str] :
+        """Versions de l'index et du prompt, qui identifient les réponses précalculées réutilisables (cf. answer_store.py)"""
+        return {"index_version": self.index_version(), "prompt_version": self.prompt_version()}
 
-        # 1 - Requête dans la base de donnée sémantique :
-        similarity_results = self.request_in_semantic_db(question)
+    def get_prompt_cache_stats(self) -> dict :
+        """Tokens d'entrée envoyés au LLM depuis la création de l'expert, dont ceux servis par le cache du préfixe"""
+        return self._prompt_cache.report()
 
-        # 2 - Création du prompt à envoyer au LLM
-        prompt = self._system_prompt.format(rag_data=similarity_results, user_prompt=question)
+    def _make_llm(self, llm_model:str) -> Runnable:
+        # Client partagé avec les autres experts de mêmes paramètres (connexion réutilisée)
+        return get_llm(llm_model,
+                       temperature=self._temperature,  # Entre 0.0 et 1.0
+                       top_p=self._top_p,              # Entre 0.0 et 1.0
+                       )
+
+    def get_llm_model(self) -> str :
+        return self._llm_model
+
+    def get_article(self, numero:str) -> Document|None :
+        """Récupère directement un article par son numéro (sans recherche de similarité)"""
+        results = self._vector_store.get(where={"article_numero": numero}, limit=1)
+        if not results["ids"] :
+            return None
+        return Document(id=results["ids"][0], page_content=results["documents"][0], metadata=results["metadatas"][0])
+
+    def generate(self, prompt:str, *, llm_model:str|None = None) -> str:
+        """Appelle le LLM de l'expert (ou un autre modèle, avec les mêmes paramètres) sur un prompt déjà construit"""
+        llm = self._llm
+        if llm_model is not None and llm_model != self._llm_model :
+            if llm_model not in self._other_llms :
+                self._other_llms[llm_model] = self._make_llm(llm_model)
+            llm = self._other_llms[llm_model]
+        usage = self._prompt_cache.usage(llm, prompt)
+        reponse = get_provider().call(self._prompt_cache.invoke, llm, prompt)
+        self.log(f"Tokens du prompt (estimés) : {usage['input_tokens']} dont {usage['cached_tokens']} servis par le cache du préfixe" +
+                 (" (simulation locale)" if self._prompt_cache.simulated else "") + "\n" +
+                 f"La réponse du LLM ({llm_model or self._llm_model}) est :\n"+reponse)
+        return reponse
+
+    def build_context(self, question:str, session:Session|None = None, scope:Scope|None = None) -> str:
+        """
+        Construit le contexte (<rag data>) pour une question (recherche dans la base sémantique comprise).
+        scope : portée de la recherche, par ex. {"livre": "II"} ou {"loi": "2021-*"} (cf. metadata_index.py)
+        """
+
+        # 1 - Requête dans la base de donnée sémantique (ou recherche déjà faite, ou réutilisation des chunks de la session) :
+        if session is None :
+            prefetched = self._prefetched.get(self._prefetch_key(question, scope))
+            if prefetched is not None :
+                _, similarity_results, chapter_notes = prefetched
+            else :
+                similarity_results, chapter_notes = self.retrieve(question, scope=scope)
+        else :
+            similarity_results, chapter_notes = self._retrieve_in_session(question, session, scope)
+
+        # 2 - Création du contexte compact
+        rag_data, self._last_context_stats = self._context_builder.build(similarity_results, chapter_notes=chapter_notes)
+        self.log("Contexte construit : " + ", ".join(f"{k}={v}" for k, v in self._last_context_stats.items()))
+        return rag_data
+
+    def build_prompt(self, question:str, rag_data:str|None = None, session:Session|None = None, scope:Scope|None = None) -> str:
+        """Construit le prompt à envoyer au LLM (à partir du contexte s'il est déjà construit)"""
+        if rag_data is None :
+            rag_data = self.build_context(question, session, scope)
+        user_prompt = question
+        history = session.history() if session is not None else ""
+        if history :
+            user_prompt = f"Historique de la conversation :\n{history}\n\nQuestion :\n{question}"
+        prompt = self._prompt.format(rag_data=rag_data, user_prompt=user_prompt)
         self.log("On interroge le LLM de l'expert avec le prompt :\n"+prompt)
+        return prompt
+
+    def ask(self, question:str, session:Session|None = None, scope:Scope|None = None) -> str:
+        """Demande quelque chose à notre agent (dans le cadre d'une conversation si session est précisée,
+        en limitant la recherche aux articles de la portée scope si elle est précisée)"""
+        prompt = self.build_prompt(question, session=session, scope=scope)
 
         # 3 - Appelle du LLM
-        reponse = self._llm.invoke(prompt)
-        self.log("La réponse du LLM est :\n"+reponse)
+        reponse = self.generate(prompt)
+        if session is not None :
+            session.add_turn(question, reponse)
         return reponse
 
-    def request_in_semantic_db(self, query:str) -> list[Document] :
+    def ask_stream(self, question:str, session:Session|None = None, scope:Scope|None = None) -> Iterator[str]:
+        """Comme ask, mais renvoie la réponse morceau par morceau, au fil de sa génération"""
+        prompt = self.build_prompt(question, session=session, scope=scope)
+        reponse = ""
+        for chunk in get_provider().stream(self._prompt_cache.stream, self._llm, prompt):
+            reponse += chunk
+            yield chunk
+        self.log("La réponse du LLM est :\n"+reponse)
+        if session is not None :
+            session.add_turn(question, reponse)
+
+    def _retrieve_in_session(self, question:str, session:Session, scope:Scope|None = None) -> tuple[list[tuple[Document, float]], dict[str, str]] :
+        """
+        Comme retrieve, mais réutilise les chunks de la recherche précédente de
+        la session si la question en est proche (une relance courte est d'abord
+        complétée par la question précédente).
+        """
+        query = session.retrieval_query_for(question)
+        prefetched = self._prefetched.get(self._prefetch_key(query, scope))
+        vector = prefetched[0] if prefetched is not None else self._embeddings.embed_query(query)
+        if session.can_reuse(vector, scope) :
+            session.nb_reused += 1
+            self.log(f"Session {session.session_id} : réutilisation des chunks de la recherche précédente ({session.retrieval_query})")
+            return session.retrieval_results, session.chapter_notes
+        if prefetched is not None :
+            _, results, chapter_notes = prefetched
+        else :
+            results, chapter_notes = self.retrieve(query, query_vector=vector, scope=scope)
+        session.remember_retrieval(query, vector, results, chapter_notes, scope)
+        return results, chapter_notes
+
+    def prefetch(self, question:str, session:Session|None = None, scope:Scope|None = None) -> bool:
+        """
+        Fait à l'avance (pendant que l'utilisateur tape sa question) la recherche
+        que fera build_context, et la garde prefetch_ttl secondes. Renvoie False
+        si elle était déjà faite (ou en cours).
+        """
+        query = session.retrieval_query_for(question) if session is not None else question
+        def compute() -> tuple[list[float], list[tuple[Document, float]], dict[str, str]] :
+            vector = self._embeddings.embed_query(query)
+            return (vector, *self.retrieve(query, query_vector=vector, scope=scope))
+        return self._prefetched.prefetch(self._prefetch_key(query, scope), compute)
+
+    def get_prefetch_stats(self) -> dict :
+        """Nombre de recherches faites à l'avance, et de questions qui en ont profité"""
+        return {**self._prefetched.stats, "cached": len(self._prefetched)}
+
+    def _prefetch_key(self, query:str, scope:Scope|None) -> tuple[str, str] :
+        return normalize_question(query), json.dumps(scope or {}, sort_keys=True)
+
+    def retrieve(self, query:str, *, query_vector:list[float]|None = None, scope:Scope|None = None) -> tuple[list[tuple[Document, float]], dict[str, str]] :
+        """
+        Récupère les chunks à mettre dans le contexte, avec leur score de pertinence,
+        ainsi que les notes de contexte par chapitre (si inject_chapter_context).
+        query_vector : vecteur de la requête, s'il est déjà calculé.
+        scope : portée de la recherche (cf. build_context).
+        """
+        chapter_notes = {}
+        mask, where = self._scope_filter(scope)
+        results, chapters = self._search(query, query_vector, mask=mask, where=where)
+        if self._inject_chapter_context :
+            # Résumé du chapitre (ce qu'il couvre), son en-tête est déjà écrit par le ContextBuilder.
+            # Les index construits avant l'ajout du résumé n'en ont pas : pas de note plutôt qu'une liste de numéros
+            chapter_notes = {doc.metadata["chapitre_cle"]: doc.metadata["chapitre_resume"] for doc in chapters
+                             if doc.metadata.get("chapitre_resume")}
+        if self._reference_graph is not None :
+            # Les articles cités hors de la portée ne sont pas ajoutés
+            allowed = set(self.get_metadata_index().values(mask, "article_numero")) if mask is not None else None
+            results = self._reference_graph.expand(results, self._vector_store, token_budget=self._reference_token_budget, allowed=allowed)
+        return results, chapter_notes
+
+    def request_in_semantic_db(self, query:str, *, scope:Scope|None = None) -> list[Document] :
         """Fait une requête dans la base de donnée sémantique"""
-        return self._vector_store.similarity_search(query=query, k=self._nb_chunks)
+        return [doc for doc, _ in self.request_in_semantic_db_with_scores(query, scope=scope)]
+
+    def request_in_semantic_db_with_scores(self, query:str, *, query_vector:list[float]|None = None, scope:Scope|None = None) -> list[tuple[Document, float]] :
+        """Fait une requête dans la base de donnée sémantique et renvoie aussi
+        le score de pertinence de chaque chunk (plus il est grand, mieux c'est)"""
+        mask, where = self._scope_filter(scope)
+        return self._search(query, query_vector, mask=mask, where=where)[0]
+
+    def get_metadata_index(self) -> MetadataIndex :
+        """Index des métadonnées des articles (construit au 1er appel, sans requête API)"""
+        with self._metadata_index_lock :
+            if self._metadata_index is None :
+                if self._local_index is not None :
+                    # Mêmes lignes que l'index local : le masque s'y applique directement
+                    self._metadata_index = MetadataIndex(self._local_index.metadatas())
+                else :
+                    self._metadata_index = MetadataIndex.from_collection(self._vector_store._collection)
+            return self._metadata_index
+
+    def _search(self, query:str, query_vector:list[float]|None = None, *, mask=None, where:dict|None = None) -> tuple[list[tuple[Document, float]], list[Document]] :
+        """
+        Recherche des nb_chunk meilleurs chunks (re-classés si rerank), et les chapitres sélectionnés (si hierarchical).
+        mask, where : portée de la recherche, calculée une fois par l'appelant (cf. _scope_filter).
+        """
+        k = self._nb_chunks if self._reranker is None else self._nb_chunks * self._rerank_factor
+
+        # 1 - Portée de la recherche vide : rien à chercher
+        if mask is not None and not mask.any() :
+            return [], []
+
+        # 2 - Recherche vectorielle (dans la portée seulement)
+        results, chapters = self._vector_search(query, query_vector, k, mask=mask, where=where)
+
+        # 3 - Re-classement
+        if self._reranker is not None :
+            results = self._reranker.rerank(query, results, k=self._nb_chunks)
+        return results, chapters
+
+    def _scope_filter(self, scope:Scope|None) -> tuple:
+        """Masque des articles de la portée (None : toute la base) et filtre Chroma équivalent (None si le masque est vide)"""
+        if not scope :
+            return None, None
+        metadata_index = self.get_metadata_index()
+        mask = metadata_index.mask(scope)
+        if mask.all() :
+            return None, None
+        if not mask.any() :
+            return mask, None
+        return mask, {"article_numero": {"$in": metadata_index.values(mask, "article_numero")}}
+
+    def _vector_search(self, query:str, query_vector:list[float]|None, k:int, *, mask=None, where:dict|None = None) -> tuple[list[tuple[Document, float]], list[Document]] :
+        """Les k chunks les plus proches (dans l'index hiérarchique, l'index local ou Chroma), et les chapitres sélectionnés"""
+        if self._hierarchical_retriever is not None :
+            chapitres = self.get_metadata_index().values(mask, "chapitre_cle") if mask is not None else None
+            if chapitres is None or chapitres :
+                return self._hierarchical_retriever.search(query, k=k, embedding=query_vector, chapitres=chapitres, where=where)
+            # Aucun article de la portée n'est rangé dans un chapitre : ils ne sont trouvés qu'à plat, ci-dessous
+        if self._local_index is not None :
+            if query_vector is None :
+                query_vector = self._embeddings.embed_query(query)
+            return self._local_index.search(query_vector, k=k, mask=mask), []
+        if query_vector is not None :
+            relevance = self._vector_store._select_relevance_score_fn()
+            return [(doc, relevance(distance)) for doc, distance in
+                    self._vector_store.similarity_search_by_vector_with_relevance_scores(query_vector, k=k, filter=where)], []
+        return self._vector_store.similarity_search_with_relevance_scores(query=query, k=k, filter=where), []
+
+    def with_parameters(self, *, temperature:float, top_p:float, nb_chunk:int) -> "AIExpertLawyer":
+        """
+        Variante de l'expert avec d'autres paramètres de génération, sans requête
+        API ni rechargement : elle partage la base sémantique et les index (en
+        lecture seule) de cet expert, mais a son propre LLM et ses propres
+        recherches faites à l'avance (qui dépendent de nb_chunk).
+        """
+        variant = copy.copy(self)
+        variant._temperature = temperature
+        variant._top_p = top_p
+        variant._nb_chunks = nb_chunk
+        variant._llm = variant._make_llm(self._llm_model)
+        variant._other_llms = {}
+        variant._prefetched = PrefetchCache(ttl=self._prefetch_ttl)
+        variant._last_context_stats = {}
+        # Index des métadonnées construit une seule fois pour l'expert et ses variantes
+        self.get_metadata_index()
+        variant._metadata_index = self._metadata_index
+        variant.log(f"Variante de l'expert : temperature={temperature}, top_p={top_p}, nb_chunk={nb_chunk}")
+        return variant
+
+    def warm_up(self) -> None:
+        """
+        Charge en mémoire ce que la 1ère question chargerait (index vectoriel de
+        Chroma, index des métadonnées) avant de mettre l'expert en service, sans
+        requête API : on cherche les voisins d'un vecteur déjà stocké.
+        """
+        batch = self._vector_store._collection.get(limit=1, include=["embeddings"])
+        if not batch["ids"] :
+            return
+        self.get_metadata_index()
+        self._vector_search("", [float(x) for x in batch["embeddings"][0]], self._nb_chunks)
 
 
 if __name__=='__main__':
@@ -118,3 +466,5 @@ if __name__=='__main__':
     reponse = expert.ask(question)
     print("###  Réponse :")
     print(f"> {reponse.replace("\n", "\n> ")}")
+    stats = expert.get_last_context_stats()
+    print(f"🪙  Tokens du contexte : {stats['tokens']} (au lieu de {stats['tokens_raw']} avec le format brut, soit {stats['tokens_saved']} économisés)")
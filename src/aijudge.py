@@ -4,14 +4,29 @@
 # Date : 10/09/2025
 
 from mytools import setup_env_variables, load_QA, create_file_if_not_exists
-from aiexpertlawyer import AIExpertLawyer
+from aiexpertlawyer import AIExpertLawyer, EXPERT_PROMPT_FIELDS
 import datetime
 from langchain_chroma import Chroma
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import GoogleGenerativeAI
 from langchain_core.documents import Document
+from provider import get_provider, get_llm
+from prompt_cache import make_prompt_cache
+from prompt_registry import InvalidPromptError, PromptTemplate, compile_prompt
 import re
 
+# Prompt utilisé pour noter une seule réponse (cf. AIJudge.score_answer), les
+# instructions fixes en premier (préfixe mis en cache, cf. prompt_cache.py)
+SCORE_ANSWER_PROMPT = ("Tu es un juriste expert. Évalue la réponse suivante à une question de droit pénal, "+
+                       "en t'appuyant sur les extraits du code pénal fournis.\n"+
+                       "Donne une note entière entre 0 (réponse fausse, vide ou hors sujet) et 10 (réponse exacte, complète et sourcée), "+
+                       "entre les deux balises <note> et <fin_note>, par exemple <note>5<fin_note>, sans autre commentaire.\n\n"+
+                       "**Extraits du code pénal** :\n{rag_data}\n\n"+
+                       "**Question** :\n{question}\n\n"+
+                       "**Réponse à évaluer** :\n{answer}\n")
+
+# Variables du prompt système du juge (obligatoires), en plus de celles de l'expert (dans l'exemple donné au juge)
+JUDGE_PROMPT_FIELDS = ("qa_text", "expert_system_prompt")
+
 class AIJudge() : 
     """Classe définissant un Agent IA qui va juger les réponses de notre expert
        en droit penal et lui proposer un nouveau prompt système. 
@@ -21,7 +36,7 @@ class AIJudge() :
     #                                                               Constructeur
     # --------------------------------------------------------------------------
 
-    def __init__(self, *, system_prompt: str| None = None, llm_model : str = "gemini-2.5-flash-lite", temperature : float = 0.3, top_p: float = 0.8, verbose: bool = True, logfile : str|None = "logs/log_AIJudge.txt") -> None:
+    def __init__(self, *, system_prompt: str| None = None, llm_model : str = "gemini-2.5-flash-lite", temperature : float = 0.3, top_p: float = 0.8, prompt_cache : str = "local", verbose: bool = True, logfile : str|None = "logs/log_AIJudge.txt") -> None:
         """Constructeur de l'Agent IA"""
 
         # Setup des variables d'environnement
@@ -31,26 +46,34 @@ class AIJudge() :
         self._verbose = verbose
 
         # 1 - Paramétrage du LLM :
-        self._llm = GoogleGenerativeAI(model=llm_model, 
-                                       temperature=temperature,  # Entre 0.0 et 1.0
-                                       top_p=top_p               # Entre 0.0 et 1.0
-                                       )
+        self._llm = get_llm(llm_model,
+                            temperature=temperature,  # Entre 0.0 et 1.0
+                            top_p=top_p,              # Entre 0.0 et 1.0
+                            )
 
         # 2 - Paramétrage du system prompt utilisé :
         if not system_prompt : # On fait un prompt par défaut
+            # Les instructions fixes viennent d'abord (préfixe identique à chaque jugement, mis en
+            # cache), puis le prompt de l'expert et ses réponses qui changent à chaque jugement
             self._system_prompt = ("Tu es un expert en prompt de LLM et un juriste expert. Tu es en charge d'évaluer les réponses d'un LLM à différentes questions en te basant sur les réponses attendues.\n" +
-                            "**Voici la listes des questions/réponses attendues/réponses données par le LLM**:\n{qa_text}\n\n"+
                             "Donne une note globale à ces réponses, un entier entre 0 et 10. La note de zéro est donnée si les réponses sont très mauvaises et la note de 10 si tu juges les réponses excellentes.\n"+
                             "Donne cette note entre les deux balises <note> et <fin_note>, par exemple <note>5<fin_note>.\n"+
-                            "Propose aussi un nouveau prompt système pour améliorer le LLM sachant que son prompt est actuellement :\n"+
-                            '"{expert_system_prompt}"\n'+
+                            "Propose aussi un nouveau prompt système pour améliorer le LLM, sachant que son prompt actuel est donné plus bas.\n"+
                             "Tu dois me proposer ce nouveau prompt système là encore entre deux balises <newprompt> et <fin_newprompt> et en utilisant absoluement les variables rag_data et user_prompt pour qu'il puisse fonctionner correctement. Par exemple :\n"
                             "<newprompt>Utilise les **données du RAG** pour répondre à la **question**.\n"+
-                            "données du RAG :\n{rag_data}\n "+
-                            "question :\n{user_prompt}\n "+
-                            "<fin_newprompt>.")
+                            "données du RAG :\n{{rag_data}}\n "+
+                            "question :\n{{user_prompt}}\n "+
+                            "<fin_newprompt>.\n\n"+
+                            "**Prompt système actuel du LLM** :\n"+
+                            '"{expert_system_prompt}"\n\n'+
+                            "**Voici la listes des questions/réponses attendues/réponses données par le LLM**:\n{qa_text}\n")
         else :
             self._system_prompt = system_prompt
+        # Modèles validés une fois pour toutes (InvalidPromptError avant toute requête API s'ils sont inutilisables)
+        self._prompt = compile_prompt(self._system_prompt, required=JUDGE_PROMPT_FIELDS, allowed=JUDGE_PROMPT_FIELDS + EXPERT_PROMPT_FIELDS)
+        self._score_prompt = compile_prompt(SCORE_ANSWER_PROMPT, required=("rag_data", "question", "answer"))
+        self._prompt_cache = make_prompt_cache(self._system_prompt, prompt_cache)
+        self._score_prompt_cache = make_prompt_cache(SCORE_ANSWER_PROMPT, prompt_cache)
 
         # 3 - Chargement des données QA
         # Je ne vais pas tout charger, juste les données que j'ai tagée avec le tag suivant :
@@ -97,9 +120,10 @@ class AIJudge() :
             with open(self._logfile, 'a', encoding='utf-8') as f:
                 f.write(("-"*80)+"\n> Log (" + datetime.datetime.now().strftime("%A, %d. %B %Y %H:%M:%S") + ") :\n" +text+"\n")
     
-    def evaluate(self, expert:AIExpertLawyer) -> tuple[int, str]:
+    def evaluate(self, expert:AIExpertLawyer) -> tuple[int, str|None]:
         """Demande à notre agent d'évaluer un AIExpertLawyer
         Renvoie la note (sur 10) et le nouveau prompt à tester !
+        (None si le prompt proposé est inutilisable, cf. check_candidate)
         """
 
         # 1 - Demande à l'expert de répondre à des questions :
@@ -123,11 +147,11 @@ class AIJudge() :
         # 2 - Création du prompt à envoyer au LLM
         if self._verbose :
             print(f"Jugement     (= une requête API !) ...", end = "", flush=True)
-        prompt = self._system_prompt.format(qa_text=qa_text, expert_system_prompt=expert.get_system_prompt(), rag_data="{rag_data}", user_prompt="{user_prompt}")
+        prompt = self._prompt.format(qa_text=qa_text, expert_system_prompt=expert.get_system_prompt(), rag_data="{rag_data}", user_prompt="{user_prompt}")
         self.log("On va invoquer le LLM du juge avec le prompt suivant :\n"+prompt)
 
         # 3 - Appelle du LLM
-        jugement = self._llm.invoke(prompt)
+        jugement = get_provider().call(self._prompt_cache.invoke, self._llm, prompt)
         self.log("Voici la réponse au prompt précédent :\n"+jugement)
 
         # 4 - Parse de la réponse pour recupérer la note et le nouveau prompt amélioré
@@ -137,14 +161,40 @@ class AIJudge() :
             print(f" Ok (la cour a rendu son verdict : {note:d}/10!).", flush=True)
 
         # 5 - Vérifie que la proposition de prompt est bien formattée et dispose des variables attendues
-        if (new_prompt.find("{rag_data}") >= 0) and (new_prompt.find("{user_prompt}") >= 0) :
+        try :
+            candidate = self.check_candidate(new_prompt)
+        except InvalidPromptError as e :
+            self.log(f"Le prompt proposé ne sera pas utilisable : {e}")
             if self._verbose :
-                print(" (Et le prompt proposé semble correct)", flush=True)
-        else :
-            raise ValueError("Le prompt proposé ne sera pas utilisable !")
+                print(f" (Mais le prompt proposé n'est pas utilisable : {e})", flush=True)
+            return note, None
+        if self._verbose :
+            print(f" (Et le prompt proposé est correct : version {candidate.version}, {candidate.tokens} tokens)", flush=True)
 
         return note, new_prompt
 
+    @staticmethod
+    def check_candidate(prompt:str|None) -> PromptTemplate:
+        """Valide un prompt système proposé pour l'expert, sans requête API (lève une InvalidPromptError s'il est inutilisable)"""
+        if prompt is None :
+            raise InvalidPromptError("Aucun prompt proposé (balises <newprompt> et <fin_newprompt> absentes)")
+        return compile_prompt(prompt, required=EXPERT_PROMPT_FIELDS)
+
+    def score_answer(self, question:str, answer:str, rag_data:str = "") -> int|None:
+        """
+        Note (sur 10) une seule réponse de l'expert, sans réponse modèle (une
+        requête API). Renvoie None si le juge n'a pas donné de note lisible.
+        """
+        prompt = self._score_prompt.format(question=question, answer=answer, rag_data=rag_data)
+        jugement = get_provider().call(self._score_prompt_cache.invoke, self._llm, prompt)
+        self.log("Note d'une réponse, le juge a répondu :\n"+jugement)
+        note, _ = self.extract_note_and_prompt(jugement)
+        return note
+
+    def get_prompt_cache_stats(self) -> dict :
+        """Tokens d'entrée envoyés au LLM du juge, dont ceux servis par le cache du préfixe (jugements, notes)"""
+        return {"evaluate": self._prompt_cache.report(), "score_answer": self._score_prompt_cache.report()}
+
     @staticmethod
     def extract_note_and_prompt(input_text:str) -> tuple[int, str]:
         """
@@ -188,6 +238,6 @@ if __name__=='__main__':
 
     # Affichage de la note et du prompt proposé
     print(f"Note donnée par le juge : {note:d}")
-    print(f"Prompt proposé par le juge :\n {proposition_prompt}")
+    print(f"Prompt proposé par le juge :\n {proposition_prompt if proposition_prompt is not None else '(inutilisable)'}")
 
     
\ No newline at end of file
@@ -0,0 +1,78 @@
+# -*- coding: utf8 -*-
+#
+# Réponses précalculées (cf. precompute_answers.py) pour les questions
+# fréquentes, stockées dans une base clé-valeur SQLite locale. La clé est la
+# question normalisée (casse, accents, ponctuation finale). Chaque réponse est
+# enregistrée avec la version de l'index et celle du prompt qui l'ont produite :
+# si l'une des deux change, la réponse n'est plus servie (et est supprimée par
+# purge(), appelée quand l'expert en service change).
+
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+from mytools import normalize_question
+
+
+class AnswerStore :
+    """Base des réponses précalculées, indexées par question normalisée"""
+
+    def __init__(self, path:str) -> None:
+        self._path = path
+        directory = os.path.dirname(path)
+        if directory :
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection :
+            connection.execute("CREATE TABLE IF NOT EXISTS answers ("
+                               "key TEXT PRIMARY KEY, question TEXT, answer TEXT, articles TEXT, "
+                               "index_version TEXT, prompt_version TEXT, created_at REAL)")
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidated": 0}
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Une connexion par opération : utilisable depuis n'importe quel thread
+        connection = sqlite3.connect(self._path, timeout=30)
+        try :
+            with connection :
+                yield connection
+        finally :
+            connection.close()
+
+    def __len__(self) -> int:
+        with self._connect() as connection :
+            return connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def get(self, question:str, *, index_version:str, prompt_version:str) -> str|None:
+        """
+        Réponse précalculée à la question, si elle a été produite avec ces
+        versions de l'index et du prompt. Sinon on ne la supprime pas : elle
+        peut rester valable pour l'expert en service, la demande pouvant venir
+        d'une variante de celui-ci (cf. purge).
+        """
+        with self._connect() as connection :
+            row = connection.execute("SELECT answer FROM answers WHERE key = ? AND index_version = ? AND prompt_version = ?",
+                                     (normalize_question(question), index_version, prompt_version)).fetchone()
+        self._count("hits" if row is not None else "misses")
+        return row[0] if row is not None else None
+
+    def put(self, question:str, answer:str, *, articles:list[str], index_version:str, prompt_version:str) -> None:
+        """Enregistre (ou remplace) la réponse à une question, avec les articles du contexte utilisé"""
+        with self._connect() as connection :
+            connection.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (normalize_question(question), question, answer, ",".join(articles),
+                                index_version, prompt_version, time.time()))
+
+    def purge(self, *, index_version:str, prompt_version:str) -> int:
+        """Supprime les réponses produites avec d'autres versions de l'index ou du prompt, renvoie leur nombre"""
+        with self._connect() as connection :
+            nb_deleted = connection.execute("DELETE FROM answers WHERE index_version != ? OR prompt_version != ?",
+                                            (index_version, prompt_version)).rowcount
+        self._count("invalidated", nb_deleted)
+        return nb_deleted
+
+    def _count(self, stat:str, n:int = 1) -> None:
+        with self._lock :
+            self.stats[stat] += n
@@ -0,0 +1,83 @@
+# Benchmark de l'index local quantifié (int8 + re-classement float16) contre
+# la recherche exacte en float32 et contre Chroma, sur les questions de QA.json.
+# Pour chaque recherche, le rappel@k est mesuré par rapport à trois références :
+#   - les k résultats de la recherche exacte (perte due à la quantification),
+#   - les k résultats de Chroma (ce que le serveur renvoie sans index local),
+#   - les articles attendus (cités dans la question ou la réponse modèle).
+# Les questions sont vectorisées comme le fait le serveur (embed_query) et les
+# vecteurs sont mis en cache : une requête API par question la 1ère fois seulement.
+import time
+
+import numpy as np
+from langchain_chroma import Chroma
+from embeddings import make_embeddings
+
+from mytools import setup_env_variables, load_QA, iter_collection
+from local_index import LocalVectorIndex
+from bench_retrieval import expected_articles
+
+# Paramètres du benchmark
+collection_name = "code_penal"
+persist_directory = "./chroma_langchain_db"
+EMBEDDINGS_CACHE = "logs/bench/embeddings_cache.jsonl" # Partagé avec bench_retrieval.py
+K = 4
+RERANK_FACTORS = [1, 2, 4, 8]
+NB_REPEAT = 20 # On répète les recherches pour avoir des temps mesurables
+
+setup_env_variables(auto=True, verbose=False)
+embeddings = make_embeddings(cache_path=EMBEDDINGS_CACHE)
+vector_store = Chroma(
+    collection_name=collection_name,
+    embedding_function=embeddings,
+    persist_directory=persist_directory,
+)
+
+# 1 - Embedding des questions (une seule fois, avec le type de tâche des requêtes)
+qa_pairs = load_QA("data/QA.json")
+print(f"1 - Embedding des {len(qa_pairs)} questions ...", flush=True)
+query_vectors = [embeddings.embed_query(qa["question"]) for qa in qa_pairs]
+expected = [expected_articles(qa) for qa in qa_pairs]
+
+# 2 - Index de référence (float32 exact), résultats de Chroma et numéros d'article des chunks
+print("2 - Construction des index ...", flush=True)
+exact_index = LocalVectorIndex.from_collection(vector_store, quantize=False)
+articles = {}
+for batch in iter_collection(vector_store._collection, include=["metadatas"]):
+    for id_, metadata in zip(batch["ids"], batch["metadatas"]):
+        articles[id_] = (metadata or {}).get("article_numero")
+
+def chroma_search(vector:list[float]) -> list[str]:
+    return vector_store._collection.query(query_embeddings=[vector], n_results=K, include=[])["ids"][0]
+
+references = {
+    "exact": [[doc.id for doc, _ in exact_index.search(vector, K)] for vector in query_vectors],
+    "Chroma": [chroma_search(vector) for vector in query_vectors],
+}
+
+def recall(found:list[str], reference:list[str]) -> float:
+    return len(set(found) & set(reference)) / len(reference) if reference else 0.0
+
+def bench(name:str, search) -> None:
+    """Affiche le rappel@K par rapport à chaque référence et la latence moyenne"""
+    recalls = {"exact": [], "Chroma": [], "attendus": []}
+    latencies = []
+    for i, vector in enumerate(query_vectors):
+        start = time.perf_counter()
+        for _ in range(NB_REPEAT):
+            found = search(vector)
+        latencies.append((time.perf_counter() - start) / NB_REPEAT * 1000)
+        recalls["exact"].append(recall(found, references["exact"][i]))
+        recalls["Chroma"].append(recall(found, references["Chroma"][i]))
+        if expected[i] :
+            recalls["attendus"].append(recall([articles.get(id_) for id_ in found], expected[i]))
+    print(f"   {name:<32} " + "  ".join(f"rappel@{K} {reference} = {np.mean(values) if values else 0.0:.3f}" for reference, values in recalls.items()) +
+          f"   latence moyenne = {np.mean(latencies):.3f} ms   p95 = {np.percentile(latencies, 95):.3f} ms")
+
+print(f"3 - Résultats ({len(exact_index)} vecteurs, {sum(1 for articles_attendus in expected if articles_attendus)} questions citant un article) :")
+print(f"   Taille des vecteurs parcourus : float32 = {exact_index.nbytes()/1e6:.2f} Mo")
+bench("float32 exact", lambda vector: [doc.id for doc, _ in exact_index.search(vector, K)])
+bench("Chroma (HNSW)", chroma_search)
+for factor in RERANK_FACTORS:
+    index = LocalVectorIndex.from_collection(vector_store, quantize=True, rerank_factor=factor)
+    bench(f"int8 + re-classement x{factor}", lambda vector: [doc.id for doc, _ in index.search(vector, K)])
+print(f"   Taille des vecteurs parcourus : int8 = {index.nbytes()/1e6:.2f} Mo")
@@ -0,0 +1,104 @@
+# -*- coding: utf8 -*-
+#
+# Benchmark de la recherche dans la base de donnée (RAG), sans LLM : on pose
+# les questions de QA.json et on regarde si les articles cités dans les
+# réponses attendues font partie des chunks renvoyés (rappel@k, précision@k,
+# MRR), ainsi que le temps de chaque recherche et la taille des chunks renvoyés
+# (tokens qui iraient dans le prompt). Les vecteurs des questions sont mis en
+# cache : après la 1ère exécution, plus aucune requête API n'est faite.
+
+import time
+from typing import Callable
+
+import numpy as np
+from langchain_core.documents import Document
+
+from mytools import load_QA, estimate_tokens
+from chunker import extract_references
+
+# Une "backend" de recherche : une question -> les chunks trouvés, du plus au moins pertinent
+Retriever = Callable[[str], list[Document]]
+
+
+def expected_articles(qa:dict) -> list[str]:
+    """Articles attendus pour une question : ceux cités dans la question ou dans la réponse modèle"""
+    articles = extract_references(qa["question"])
+    return articles + [numero for numero in extract_references(qa["answer"]) if numero not in articles]
+
+
+def run_benchmark(retrieve:Retriever, qa_pairs:list[dict], *, k_values:tuple[int, ...] = (1, 3, 5, 10)) -> dict:
+    """
+    Passe toutes les questions (qui citent au moins un article) dans retrieve.
+
+    Returns:
+        Un dictionnaire avec le rappel@k (part des articles attendus retrouvés
+        dans les k premiers chunks) et la précision@k (part des k premiers
+        chunks qui sont attendus) pour chaque k, le MRR (inverse du rang du
+        premier article attendu trouvé), le nombre moyen de tokens des chunks
+        renvoyés et les percentiles de latence (ms).
+    """
+    recalls = {k: [] for k in k_values}
+    precisions = {k: [] for k in k_values}
+    reciprocal_ranks, latencies, tokens = [], [], []
+    nb_skipped = 0
+    for qa in qa_pairs:
+        expected = expected_articles(qa)
+        if not expected :
+            nb_skipped += 1
+            continue
+
+        start = time.perf_counter()
+        documents = retrieve(qa["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        found = [doc.metadata.get("article_numero") for doc in documents]
+        tokens.append(sum(estimate_tokens(doc.page_content) for doc in documents))
+        for k in k_values:
+            recalls[k].append(len(set(found[:k]) & set(expected)) / len(expected))
+            if len(found) >= k :
+                precisions[k].append(len(set(found[:k]) & set(expected)) / k)
+        ranks = [rank for rank, numero in enumerate(found, start=1) if numero in expected]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+
+    return {
+        "nb_questions": len(latencies),
+        "nb_skipped": nb_skipped,
+        "recall": {k: float(np.mean(values)) if values else 0.0 for k, values in recalls.items()},
+        "precision": {k: float(np.mean(values)) if values else 0.0 for k, values in precisions.items()},
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "tokens": float(np.mean(tokens)) if tokens else 0.0,
+        "latency_ms": {p: float(np.percentile(latencies, p)) if latencies else 0.0 for p in (50, 90, 99)},
+    }
+
+
+def print_report(name:str, results:dict) -> None:
+    recalls = "  ".join(f"R@{k}={value:.2f}" for k, value in results["recall"].items())
+    precisions = "  ".join(f"P@{k}={value:.2f}" for k, value in results["precision"].items())
+    latencies = "  ".join(f"p{p}={value:.1f}ms" for p, value in results["latency_ms"].items())
+    print(f"{name:<36} {recalls}  {precisions}  MRR={results['mrr']:.3f}  tokens={results['tokens']:.0f}  {latencies}")
+
+
+if __name__ == "__main__":
+
+    from aiexpertlawyer import AIExpertLawyer
+
+    # Fichier de cache des vecteurs des questions (partagé entre les exécutions)
+    EMBEDDINGS_CACHE = "logs/bench/embeddings_cache.jsonl"
+
+    # Configurations de l'expert à comparer (seule la recherche est utilisée, pas le LLM)
+    CONFIGS = {
+        "nb_chunk=4": dict(nb_chunk=4),
+        "nb_chunk=10": dict(nb_chunk=10),
+        "nb_chunk=10 hiérarchique": dict(nb_chunk=10, hierarchical=True),
+        "nb_chunk=10 index local int8": dict(nb_chunk=10, local_index=True),
+        # Re-classement de 4 x nb_chunk candidats : autant de tokens que nb_chunk=4, meilleure précision ?
+        "nb_chunk=4 rerank lexical": dict(nb_chunk=4, rerank="lexical"),
+    }
+
+    qa_pairs = load_QA("data/QA.json")
+    print(f"Benchmark de la recherche sur {len(qa_pairs)} questions de QA.json")
+    for name, config in CONFIGS.items():
+        expert = AIExpertLawyer(logfile=None, embeddings_cache=EMBEDDINGS_CACHE, **config)
+        # Un premier passage pour remplir le cache des vecteurs (et ne mesurer ensuite que la recherche)
+        run_benchmark(expert.request_in_semantic_db, qa_pairs)
+        print_report(name, run_benchmark(expert.request_in_semantic_db, qa_pairs))
@@ -0,0 +1,39 @@
+# -*- coding: utf8 -*-
+#
+# Décompte des étages du routage (cf. router.py) sur les questions de QA.json,
+# sans LLM : la réponse modèle de chaque question tient lieu de réponse de
+# l'étage "cheap" (une bonne réponse, qui ne devrait pas escalader), avec le
+# contexte que l'expert construirait pour la question. On compare les étages
+# obtenus avec et sans require_citation : toute réponse modèle envoyée à
+# l'étage "strong" est une escalade (donc un coût) inutile. Les vecteurs des
+# questions sont mis en cache : une requête API par question la 1ère fois seulement.
+
+from mytools import setup_env_variables, load_QA
+from router import TIERS, is_article_lookup, looks_weak
+
+
+def routed_tier(qa:dict, rag_data:str, *, require_citation:bool) -> str:
+    """Étage auquel la question serait servie si l'étage "cheap" donnait la réponse modèle"""
+    if is_article_lookup(qa["question"]) is not None :
+        return "template"
+    return "strong" if looks_weak(qa["answer"], rag_data, require_citation=require_citation) else "cheap"
+
+
+if __name__ == "__main__" :
+    from aiexpertlawyer import AIExpertLawyer
+
+    EMBEDDINGS_CACHE = "logs/bench/embeddings_cache.jsonl" # Partagé avec bench_retrieval.py
+
+    setup_env_variables(auto=True, verbose=False)
+    qa_pairs = load_QA("data/QA.json")
+    expert = AIExpertLawyer(logfile=None, embeddings_cache=EMBEDDINGS_CACHE)
+    contexts = [expert.build_context(qa["question"]) for qa in qa_pairs]
+
+    print(f"Étages du routage pour les {len(qa_pairs)} questions de QA.json (réponse modèle comme réponse \"cheap\") :")
+    for require_citation in (False, True):
+        tiers = [routed_tier(qa, rag_data, require_citation=require_citation) for qa, rag_data in zip(qa_pairs, contexts)]
+        counts = "  ".join(f"{tier} = {tiers.count(tier)}" for tier in TIERS)
+        print(f"   require_citation={str(require_citation):<5}  {counts}")
+        for qa, tier in zip(qa_pairs, tiers):
+            if tier == "strong" :
+                print(f"      -> strong : {qa['question'].strip()[:70]!r} ({qa.get('tag', '')})")
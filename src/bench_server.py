@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+#
+# Benchmark du serveur (interface.py) sous charge : NB_CLIENTS clients envoient
+# en parallèle NB_REQUESTS requêtes et on compare, pour chaque scénario, les
+# percentiles de latence, le débit et la taille des réponses sur le réseau :
+#   - réponses compressées (gzip / br) ou non,
+#   - revalidation de la page web par son ETag (304 sans contenu),
+#   - une connexion HTTP gardée ouverte par client (keep-alive) ou une nouvelle
+#     connexion à chaque requête.
+# Le serveur doit être lancé à part (cf. SERVER_URL). Les questions posées à
+# /ask sont celles de QA.json : si elles ont été précalculées
+# (precompute_answers.py), aucune requête API n'est faite.
+
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from mytools import load_QA
+
+SERVER_URL = os.environ.get("SERVER_URL", "http://localhost:8000")
+NB_CLIENTS = 16
+NB_REQUESTS = 400
+
+
+class Client :
+    """Un client HTTP (un par thread), qui garde sa connexion ouverte si keep_alive"""
+
+    def __init__(self, url:str, *, keep_alive:bool) -> None:
+        parts = urlsplit(url)
+        self._host, self._port = parts.hostname, parts.port or 80
+        self._keep_alive = keep_alive
+        self._connection = None
+
+    def request(self, method:str, path:str, *, body:dict|None = None, headers:dict|None = None) -> tuple[int, int]:
+        """Envoie la requête et renvoie (statut, octets reçus dans le corps, tels qu'envoyés sur le réseau)"""
+        if self._connection is None :
+            self._connection = http.client.HTTPConnection(self._host, self._port, timeout=120)
+        headers = dict(headers or {})
+        if body is not None :
+            headers["Content-Type"] = "application/json"
+        if not self._keep_alive :
+            headers["Connection"] = "close"
+        try :
+            self._connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self._connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError) :
+            self._connection.close()
+            self._connection = None
+            raise
+        if not self._keep_alive or response.will_close :
+            self._connection.close()
+            self._connection = None
+        return response.status, len(content)
+
+
+def run_scenario(make_request, *, keep_alive:bool = True, nb_clients:int = NB_CLIENTS, nb_requests:int = NB_REQUESTS) -> dict:
+    """
+    Lance nb_requests appels de make_request(client, i) répartis sur nb_clients threads.
+
+    Returns:
+        Un dictionnaire avec le débit (requêtes / s), les percentiles de latence
+        (ms), la taille moyenne des réponses (octets) et le nombre d'erreurs.
+    """
+    local = threading.local()
+    latencies, sizes = [], []
+    nb_errors = 0
+    lock = threading.Lock()
+
+    def one_request(i:int) -> None:
+        nonlocal nb_errors
+        if not hasattr(local, "client") :
+            local.client = Client(SERVER_URL, keep_alive=keep_alive)
+        start = time.perf_counter()
+        try :
+            status, size = make_request(local.client, i)
+        except Exception :
+            status, size = None, 0
+        latency = (time.perf_counter() - start) * 1000
+        with lock :
+            if status is None or status >= 400 :
+                nb_errors += 1
+            else :
+                latencies.append(latency)
+                sizes.append(size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=nb_clients) as executor :
+        list(executor.map(one_request, range(nb_requests)))
+    duration = time.perf_counter() - start
+
+    return {
+        "throughput": len(latencies) / duration,
+        "latency_ms": {p: float(np.percentile(latencies, p)) if latencies else 0.0 for p in (50, 90, 99)},
+        "bytes": float(np.mean(sizes)) if sizes else 0.0,
+        "nb_errors": nb_errors,
+    }
+
+
+def fetch_etag(url:str, path:str = "/") -> str|None:
+    """ETag de la page renvoyée par le serveur"""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try :
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.getheader("ETag")
+    finally :
+        connection.close()
+
+
+def print_report(name:str, results:dict) -> None:
+    latencies = "  ".join(f"p{p}={value:.1f}ms" for p, value in results["latency_ms"].items())
+    print(f"{name:<36} {results['throughput']:7.1f} req/s  {latencies}  {results['bytes']:8.0f} octets  {results['nb_errors']} erreurs")
+
+
+if __name__ == "__main__":
+
+    questions = [qa["question"] for qa in load_QA("data/QA.json")]
+    etag = fetch_etag(SERVER_URL)
+
+    def get_page(encoding:str, revalidate:bool = False) :
+        headers = {"Accept-Encoding": encoding}
+        if revalidate and etag :
+            headers["If-None-Match"] = etag
+        return lambda client, i: client.request("GET", "/", headers=headers)
+
+    def ask(encoding:str) :
+        return lambda client, i: client.request("POST", "/ask", body={"question": questions[i % len(questions)]},
+                                                headers={"Accept-Encoding": encoding})
+
+    SCENARIOS = {
+        "GET / sans compression": (get_page("identity"), True),
+        "GET / gzip": (get_page("gzip"), True),
+        "GET / br": (get_page("br"), True),
+        "GET / revalidation ETag (304)": (get_page("gzip", revalidate=True), True),
+        "GET / gzip, connexion par requête": (get_page("gzip"), False),
+        "POST /ask sans compression": (ask("identity"), True),
+        "POST /ask gzip": (ask("gzip"), True),
+    }
+
+    print(f"Benchmark de {SERVER_URL} : {NB_REQUESTS} requêtes par scénario, {NB_CLIENTS} clients en parallèle")
+    for name, (make_request, keep_alive) in SCENARIOS.items():
+        print_report(name, run_scenario(make_request, keep_alive=keep_alive))
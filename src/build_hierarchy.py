@@ -0,0 +1,23 @@
+# Construction de l'index hiérarchique (un vecteur par chapitre) à partir des
+# articles déjà présents dans la base de donnée (RAG).
+# Aucune requête API : on réutilise les vecteurs des articles.
+from langchain_chroma import Chroma
+
+from hierarchical_index import build_chapter_index, chapter_collection_name
+
+# Collection des articles à résumer par chapitre
+collection_name = "code_penal"
+persist_directory = "./chroma_langchain_db"
+
+article_store = Chroma(
+    collection_name=collection_name,
+    persist_directory=persist_directory,
+)
+chapter_store = Chroma(
+    collection_name=chapter_collection_name(collection_name),
+    persist_directory=persist_directory,
+)
+
+print(f"Nombre d'articles dans la collection '{collection_name}' : {article_store._collection.count()}")
+nb_chapitres = build_chapter_index(article_store, chapter_store)
+print(f"Nombre de chapitres indexés dans '{chapter_collection_name(collection_name)}' : {nb_chapitres}")
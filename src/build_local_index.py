@@ -0,0 +1,20 @@
+# Export de la base de donnée (RAG) vers un index local compact : vecteurs
+# quantifiés en int8 pour la recherche et float16 pour le re-classement.
+# Aucune requête API : on réutilise les vecteurs déjà calculés.
+from langchain_chroma import Chroma
+
+from local_index import LocalVectorIndex, local_index_path
+
+# Collection à exporter
+collection_name = "code_penal"
+persist_directory = "./chroma_langchain_db"
+
+vector_store = Chroma(
+    collection_name=collection_name,
+    persist_directory=persist_directory,
+)
+
+index = LocalVectorIndex.from_collection(vector_store, quantize=True)
+path = local_index_path(persist_directory, collection_name)
+index.save(path)
+print(f"Index local sauvegardé dans {path} : {len(index)} vecteurs, {index.nbytes()/1e6:.2f} Mo parcourus par recherche.")
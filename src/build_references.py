@@ -0,0 +1,20 @@
+# Construction du graphe des renvois entre articles à partir des articles déjà
+# présents dans la base de donnée (RAG). Aucune requête API.
+# Le graphe est sauvegardé dans le dossier de la base, à côté de la collection.
+from langchain_chroma import Chroma
+
+from references import ReferenceGraph, references_path
+
+# Collection dont on veut le graphe des renvois
+collection_name = "code_penal"
+persist_directory = "./chroma_langchain_db"
+
+vector_store = Chroma(
+    collection_name=collection_name,
+    persist_directory=persist_directory,
+)
+
+graph = ReferenceGraph.from_collection(vector_store)
+path = references_path(persist_directory, collection_name)
+graph.save(path)
+print(f"Graphe des renvois sauvegardé dans {path} : {len(graph)} renvois.")
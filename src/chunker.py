@@ -6,6 +6,34 @@ from typing import List, Dict, Optional
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
 
+def chapitre_cle(metadata: Dict) -> Optional[str]:
+    """
+    Clé identifiant le chapitre d'un article (ex: "I/III/I" pour Livre I,
+    Titre III, Chapitre I). Renvoie None si l'article n'a pas de livre connu.
+    """
+    if metadata.get('livre_numero') is None:
+        return None
+    return "/".join(metadata.get(f'{niveau}_numero') or '-' for niveau in ('livre', 'titre', 'chapitre'))
+
+# Pattern des renvois à d'autres articles ("article 131-7", "articles 131-6 et 131-7", ...)
+REFERENCE_PATTERN = re.compile(r'articles?\s+((?:\d{3}-\d+(?:-\d+)?(?:\s*(?:,|et|ou|à)\s*)?)+)', re.IGNORECASE)
+# Renvois vers un autre texte que le code pénal, qu'on ne peut pas résoudre
+EXTERNAL_REFERENCE_PATTERN = re.compile(r"\s*(?:du|de la|de l')\s+(?!présent|code pénal)(?:code|loi|ordonnance|décret)", re.IGNORECASE)
+
+def extract_references(text: str, own_article: Optional[str] = None) -> List[str]:
+    """
+    Extrait les numéros d'articles du code pénal cités dans un texte (sans
+    doublons, dans l'ordre d'apparition, et sans l'article lui-même).
+    """
+    references = []
+    for match in REFERENCE_PATTERN.finditer(text):
+        if EXTERNAL_REFERENCE_PATTERN.match(text, match.end()):
+            continue
+        for numero in re.findall(r'\d{3}-\d+(?:-\d+)?', match.group(1)):
+            if numero != own_article and numero not in references:
+                references.append(numero)
+    return references
+
 class CodePenalChunker:
     """
     Chunker intelligent pour le Code pénal français qui respecte la structure juridique
@@ -92,7 +120,7 @@ class CodePenalChunker:
                     if chunk_text.strip():
                         chunks.append(Document(
                             page_content=chunk_text,
-                            metadata=current_metadata.copy()
+                            metadata=self._add_references(current_metadata.copy(), chunk_text)
                         ))
                 
                 # Commencer un nouveau chunk
@@ -131,7 +159,7 @@ class CodePenalChunker:
             if chunk_text.strip():
                 chunks.append(Document(
                     page_content=chunk_text,
-                    metadata=current_metadata
+                    metadata=self._add_references(current_metadata, chunk_text)
                 ))
         
         return chunks
@@ -144,6 +172,8 @@ class CodePenalChunker:
                 'numero': livre_match.group(1),
                 'titre': livre_match.group(2).strip()
             }
+            # Les niveaux inférieurs du Livre précédent ne s'appliquent plus
+            structure['titre'] = structure['chapitre'] = structure['section'] = None
             return
         
         titre_match = re.search(self.titre_pattern, line, re.IGNORECASE)
@@ -152,6 +182,7 @@ class CodePenalChunker:
                 'numero': titre_match.group(1),
                 'titre': titre_match.group(2).strip()
             }
+            structure['chapitre'] = structure['section'] = None
             return
         
         chapitre_match = re.search(self.chapitre_pattern, line, re.IGNORECASE)
@@ -160,6 +191,7 @@ class CodePenalChunker:
                 'numero': chapitre_match.group(1),
                 'titre': chapitre_match.group(2).strip()
             }
+            structure['section'] = None
             return
         
         section_match = re.search(self.section_pattern, line, re.IGNORECASE)
@@ -206,6 +238,11 @@ class CodePenalChunker:
         if structure['section']:
             metadata['section_numero'] = structure['section']['numero']
             metadata['section_titre'] = structure['section']['titre']
+
+        # Clé du chapitre (utilisée par l'index hiérarchique)
+        cle = chapitre_cle(metadata)
+        if cle is not None:
+            metadata['chapitre_cle'] = cle
         
         # Extraire les références légales
         loi_match = re.search(self.loi_pattern, article_line)
@@ -220,6 +257,14 @@ class CodePenalChunker:
         
         return metadata
     
+    def _add_references(self, metadata: Dict, text: str) -> Dict:
+        """Ajoute aux métadonnées les articles cités dans le texte du chunk."""
+        # Chroma n'accepte pas les listes dans les métadonnées : on stocke une chaîne
+        references = extract_references(text, metadata.get('article_numero'))
+        if references:
+            metadata['articles_cites'] = ",".join(references)
+        return metadata
+
     def _clean_chunk_text(self, text: str) -> str:
         """
         Nettoie le texte complet d'un chunk en supprimant les éléments indésirables.
@@ -0,0 +1,42 @@
+# -*- coding: utf8 -*-
+#
+# Compression des réponses HTTP du serveur : brotli si le client l'accepte et
+# que le package brotli-asgi est installé, gzip sinon. Les chemins exclus (flux
+# de tokens) ne sont jamais compressés, pour que chaque morceau parte tout de
+# suite au lieu d'attendre de remplir le tampon du compresseur.
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try :
+    from brotli_asgi import BrotliMiddleware
+except ImportError :
+    BrotliMiddleware = None
+
+
+class CompressionMiddleware :
+    """Middleware ASGI qui choisit l'encodage (br, gzip ou aucun) selon la requête"""
+
+    def __init__(self, app:ASGIApp, *, minimum_size:int = 500, exclude_paths:tuple[str, ...] = ()) -> None:
+        """
+        Args:
+            minimum_size: taille (octets) en dessous de laquelle une réponse n'est pas compressée
+            exclude_paths: chemins dont les réponses ne sont jamais compressées
+        """
+        self._app = app
+        self._exclude_paths = exclude_paths
+        self._gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=6)
+        self._brotli = None
+        if BrotliMiddleware is not None :
+            self._brotli = BrotliMiddleware(app, quality=4, minimum_size=minimum_size, gzip_fallback=False)
+
+    async def __call__(self, scope:Scope, receive:Receive, send:Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self._exclude_paths :
+            await self._app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        if self._brotli is not None and "br" in accept_encoding :
+            await self._brotli(scope, receive, send)
+        else :
+            await self._gzip(scope, receive, send)
@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+#
+# Construction compacte du contexte (<rag data>) envoyé au LLM à partir des
+# chunks renvoyés par la base de donnée sémantique.
+
+import re
+
+from mytools import estimate_tokens
+from langchain_core.documents import Document
+
+# Niveaux hiérarchiques du code pénal (extraits par le chunker), du plus haut
+# au plus bas : (clé dans les métadonnées, libellé affiché)
+HIERARCHY_LEVELS = [("livre", "Livre"), ("titre", "Titre"), ("chapitre", "Chapitre"), ("section", "Section")]
+
+# En dessous de ce nombre de tokens restants, ça ne vaut plus le coup de
+# tronquer un chunk pour le faire rentrer dans le budget
+MIN_TRUNCATED_TOKENS = 40
+
+
+def hierarchy_header(metadata:dict) -> str:
+    """Renvoie l'en-tête hiérarchique (Livre > Titre > Chapitre > Section) d'un chunk"""
+    parts = []
+    for key, label in HIERARCHY_LEVELS:
+        numero = metadata.get(f"{key}_numero")
+        if numero is None :
+            continue
+        titre = metadata.get(f"{key}_titre")
+        parts.append(f"{label} {numero} : {titre}" if titre else f"{label} {numero}")
+    return " > ".join(parts)
+
+
+def context_articles(context:str) -> list[str]:
+    """Numéros des articles présents dans un contexte construit par le ContextBuilder"""
+    return re.findall(r"\[Art\. ([^\]]+)\]", context)
+
+
+def render_article(doc:Document) -> str:
+    """Rendu compact d'un article : "[Art. 131-7] texte de l'article" """
+    text = doc.page_content.strip()
+    numero = doc.metadata.get("article_numero")
+    if numero is None :
+        return text
+    # Le numéro de l'article est déjà en tête du chunk, inutile de le répéter
+    if text.startswith(numero):
+        text = text[len(numero):].lstrip()
+    return f"[Art. {numero}] {text}"
+
+
+class ContextBuilder :
+    """
+    Construit le texte <rag data> à partir des chunks de la base sémantique :
+      - les chunks sont rendus de façon compacte (pas de repr Python ni de
+        dictionnaire de métadonnées),
+      - les en-têtes hiérarchiques communs ne sont écrits qu'une fois,
+      - un budget de tokens est respecté en tronquant puis en abandonnant les
+        chunks les moins pertinents.
+    """
+
+    def __init__(self, *, token_budget:int|None = 2000, min_score:float|None = None) -> None:
+        """
+        Args:
+            token_budget: nombre maximal (estimé) de tokens du contexte, None pour aucune limite
+            min_score: les chunks dont le score de pertinence est inférieur sont ignorés
+        """
+        self._token_budget = token_budget
+        self._min_score = min_score
+
+    def build(self, scored_docs:list[tuple[Document, float]], *, chapter_notes:dict[str, str]|None = None) -> tuple[str, dict]:
+        """
+        Construit le contexte à partir de couples (Document, score de pertinence),
+        le score étant d'autant plus grand que le chunk est pertinent.
+        chapter_notes associe éventuellement à une clé de chapitre ('chapitre_cle')
+        une ligne de contexte écrite (une seule fois) sous l'en-tête du chapitre.
+
+        Returns:
+            Le texte du contexte et un dictionnaire de statistiques (dont
+            l'économie de tokens par rapport au format brut list[Document]).
+        """
+        # 1 - Tri par pertinence décroissante et filtre sur le score
+        ranked = sorted(scored_docs, key=lambda doc_score: doc_score[1], reverse=True)
+        if self._min_score is not None :
+            ranked = [(doc, score) for doc, score in ranked if score >= self._min_score]
+
+        # 2 - Sélection des chunks dans la limite du budget
+        budget = self._token_budget
+        used = 0
+        nb_truncated = 0
+        groups : dict[str, list[str]] = {} # en-tête -> articles (l'ordre d'insertion suit la pertinence)
+        notes_done = set()
+        for doc, _ in ranked:
+            header = hierarchy_header(doc.metadata)
+            article = render_article(doc)
+            cle = doc.metadata.get("chapitre_cle")
+            note = (chapter_notes or {}).get(cle) if cle not in notes_done else None
+            if note :
+                article = f"({note})\n{article}"
+            cost = estimate_tokens(article) + (0 if header in groups else estimate_tokens(header))
+            if budget is not None and used + cost > budget :
+                remaining = budget - used - (cost - estimate_tokens(article))
+                if remaining < MIN_TRUNCATED_TOKENS :
+                    break
+                article = self._truncate(article, remaining)
+                cost = budget - used
+                nb_truncated += 1
+            groups.setdefault(header, []).append(article)
+            if note :
+                notes_done.add(cle)
+            used += cost
+            if budget is not None and used >= budget :
+                break
+
+        # 3 - Rendu
+        blocks = []
+        for header, articles in groups.items():
+            blocks.append("\n".join(([f"## {header}"] if header else []) + articles))
+        context = "\n\n".join(blocks)
+
+        # 4 - Statistiques (comparaison avec l'ancien format : repr de list[Document])
+        tokens = estimate_tokens(context)
+        tokens_raw = estimate_tokens(str([doc for doc, _ in scored_docs]))
+        stats = {
+            "nb_chunks_in": len(scored_docs),
+            "nb_chunks_out": sum(len(articles) for articles in groups.values()),
+            "nb_truncated": nb_truncated,
+            "tokens": tokens,
+            "tokens_raw": tokens_raw,
+            "tokens_saved": tokens_raw - tokens,
+        }
+        return context, stats
+
+    @staticmethod
+    def _truncate(text:str, max_tokens:int) -> str:
+        """Tronque un texte à environ max_tokens tokens (en coupant sur un espace)"""
+        max_chars = max(0, max_tokens * 4 - 4)
+        if len(text) <= max_chars :
+            return text
+        cut = text.rfind(" ", 0, max_chars)
+        return text[:cut if cut > 0 else max_chars] + " […]"
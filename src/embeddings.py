@@ -0,0 +1,122 @@
+# -*- coding: utf8 -*-
+#
+# Gestion des embeddings : modèle utilisé, réduction de dimension par
+# troncature "Matryoshka" (gemini-embedding-001 est entraîné pour que les
+# premières composantes de ses vecteurs restent utilisables seules), cache
+# des vecteurs des requêtes, et vérification que la dimension d'une collection
+# est bien celle attendue.
+
+import json
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_chroma import Chroma
+
+from mytools import create_file_if_not_exists
+from provider import RateLimitedEmbeddings, get_embeddings_client
+
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+FULL_DIMENSION = 3072
+
+# Clés des métadonnées de collection Chroma décrivant les vecteurs stockés
+METADATA_MODEL_KEY = "embedding_model"
+METADATA_DIMENSION_KEY = "embedding_dimension"
+
+
+def truncate(vector:list[float], dimension:int) -> list[float]:
+    """Garde les dimension premières composantes d'un vecteur et le renormalise"""
+    prefix = np.asarray(vector[:dimension], dtype=np.float32)
+    return (prefix / (np.linalg.norm(prefix) or 1.0)).tolist()
+
+
+class MatryoshkaEmbeddings(Embeddings) :
+    """Embeddings tronqués aux dimension premières composantes (puis renormalisés)"""
+
+    def __init__(self, embeddings:Embeddings, dimension:int) -> None:
+        self._embeddings = embeddings
+        self.dimension = dimension
+
+    def embed_documents(self, texts:list[str]) -> list[list[float]]:
+        return [truncate(vector, self.dimension) for vector in self._embeddings.embed_documents(texts)]
+
+    def embed_query(self, text:str) -> list[float]:
+        return truncate(self._embeddings.embed_query(text), self.dimension)
+
+
+class CachedEmbeddings(Embeddings) :
+    """
+    Embeddings dont les vecteurs des requêtes sont gardés en cache (et
+    éventuellement sauvegardés dans un fichier JSONL pour les exécutions
+    suivantes) : une même question n'est embeddée qu'une seule fois.
+    """
+
+    def __init__(self, embeddings:Embeddings, path:str|None = None) -> None:
+        self._embeddings = embeddings
+        self._path = path
+        self._cache : dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        if path is not None and create_file_if_not_exists(path) :
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._cache[entry["text"]] = entry["vector"]
+
+    def embed_documents(self, texts:list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text:str) -> list[float]:
+        vector = self._cache.get(text)
+        if vector is not None :
+            return vector
+        vector = self._embeddings.embed_query(text)
+        with self._lock :
+            self._cache[text] = vector
+            if self._path is not None :
+                with open(self._path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"text": text, "vector": vector}, ensure_ascii=False) + "\n")
+        return vector
+
+
+def make_embeddings(dimension:int|None = None, *, cache_path:str|None = None) -> Embeddings:
+    """
+    Embeddings du projet, tronqués à dimension si elle est précisée (et plus
+    petite que la dimension complète). Si cache_path est précisé, les vecteurs
+    des requêtes sont mis en cache dans ce fichier (cf. CachedEmbeddings).
+    """
+    # Les appels à l'API passent par le client commun du fournisseur (débit, quotas)
+    embeddings = RateLimitedEmbeddings(get_embeddings_client(EMBEDDING_MODEL))
+    if cache_path is not None :
+        # Le cache contient les vecteurs complets : il sert quelle que soit la dimension
+        embeddings = CachedEmbeddings(embeddings, cache_path)
+    if dimension is None or dimension >= FULL_DIMENSION :
+        return embeddings
+    return MatryoshkaEmbeddings(embeddings, dimension)
+
+
+def collection_metadata(dimension:int|None = None) -> dict:
+    """Métadonnées à poser sur une collection à sa création"""
+    return {METADATA_MODEL_KEY: EMBEDDING_MODEL, METADATA_DIMENSION_KEY: dimension or FULL_DIMENSION}
+
+
+def collection_dimension(vector_store:Chroma) -> int|None:
+    """
+    Dimension des vecteurs d'une collection : lue dans ses métadonnées, ou à
+    défaut (collections plus anciennes) sur le premier vecteur stocké.
+    None si la collection est vide.
+    """
+    metadata = vector_store._collection.metadata or {}
+    if METADATA_DIMENSION_KEY in metadata :
+        return int(metadata[METADATA_DIMENSION_KEY])
+    sample = vector_store._collection.get(limit=1, include=["embeddings"])
+    if len(sample["ids"]) == 0 :
+        return None
+    return len(sample["embeddings"][0])
+
+
+def check_dimension(actual:int|None, expected:int|None, what:str) -> None:
+    """Lève une erreur explicite si la dimension des vecteurs stockés n'est pas celle des requêtes"""
+    expected = expected or FULL_DIMENSION
+    if actual is not None and actual != expected :
+        raise ValueError(f"{what} contient des vecteurs de dimension {actual} mais les requêtes "
+                         f"seraient de dimension {expected} (cf. le paramètre embedding_dimension).")
@@ -1,53 +1,253 @@
-# Un peu d'exploration de la base de donnée mais sans requète API (donc en n'utilisant pas le RAG ...)
-# Juste pour voir si on a bien réussi à charger la base !
-# Auteur : Xavier BEDNAREK
-# Date   : 2025-09-09
-import os
-import getpass
-import time
-from tqdm import tqdm
-
-from langchain_chroma import Chroma
-
-# Parametrage de Chroma
-vector_store = Chroma(
-    collection_name="code_penal",
-    persist_directory="./chroma_langchain_db",  # Where to save data locally, remove if not necessary
-)
-
-# Nombre de vecteurs dans le RAG :
-collection = vector_store._collection
-count = collection.count()
-print(f"Nombre de vecteurs dans le vector store : {count}")
-
-# Récupéreration de tous les documents
-print("\n=== Récupérer tous les documents ===")
-all_data = vector_store.get()
-print(f"Clés disponibles : {all_data.keys()}")
-print(f"Nombre d'IDs : {len(all_data['ids'])}")
-
-# Afficher les premiers documents
-for i in range(min(3, len(all_data['ids']))):  # Afficher les 3 premiers
-    print(f"\nDocument {i+1}:")
-    print(f"ID: {all_data['ids'][i]}")
-    print(f"Métadonnées: {all_data['metadatas'][i]}")
-    print(f"Contenu: {all_data['documents'][i][:200]}...")  # Premiers 200 caractères
-
-# Récupérer avec des filtres sur les métadonnées
-print("\n=== Filtrer par métadonnées ===")
-# Exemple : récupérer tous les documents d'un article spécifique
-try:
-    # Vous devez adapter le filtre selon vos métadonnées
-    filtered_docs = vector_store.get(
-        where={"article_numero": "131-7"}  # Exemple : article numéro 131-7
-    )
-    print(f"Documents trouvés avec filtre : {len(filtered_docs['ids'])}")
-    
-    if filtered_docs['ids']:
-        print(f"Premier document filtré:")
-        print(f"ID: {filtered_docs['ids'][0]}")
-        print(f"Métadonnées: {filtered_docs['metadatas'][0]}")
-        print(f"Contenu: {filtered_docs['documents'][0][:200]}...")
-        
-except Exception as e:
-    print(f"Erreur avec le filtre : {e}")
\ No newline at end of file
+# Exploration et export de la base de donnée (RAG) sans requête API (donc sans
+# utiliser le RAG ...). Les collections sont parcourues par paquets de
+# --batch-size éléments : la mémoire utilisée ne dépend pas de la taille de la
+# base (hormis l'empreinte de 8 octets par chunk pour détecter les doublons).
+#
+#   python src/explore_db.py collections                      # collections et nombre de vecteurs
+#   python src/explore_db.py show --limit 3                   # premiers chunks
+#   python src/explore_db.py stats                            # chunks par Livre, normes, doublons
+#   python src/explore_db.py query --where '{"article_numero": "131-7"}'
+#   python src/explore_db.py query --where '{"livre_numero": "II"}' --contains "récidive" --count
+#   python src/explore_db.py export data/code_penal.jsonl     # ou .parquet (package pyarrow)
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import Counter
+
+import chromadb
+import numpy as np
+
+from mytools import iter_collection, normalize_question
+
+CHROMA_DB_PATH = "./chroma_langchain_db"
+COLLECTION_NAME = "code_penal"
+BATCH_SIZE = 500
+
+# Nombre maximal de doublons affichés par stats
+MAX_DUPLICATES_SHOWN = 10
+
+
+def content_digest(text:str) -> bytes:
+    """Empreinte (8 octets) du contenu normalisé d'un chunk : deux chunks identiques aux espaces, à la casse et aux accents près ont la même"""
+    return hashlib.blake2b(normalize_question(text).encode("utf-8"), digest_size=8).digest()
+
+
+def iter_records(collection, *, batch_size:int = BATCH_SIZE, embeddings:bool = False, where:dict|None = None, where_document:dict|None = None):
+    """Chunks de la collection un par un (dictionnaires id, document, metadata et éventuellement embedding)"""
+    include = ["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+    for batch in iter_collection(collection, batch_size=batch_size, include=include, where=where, where_document=where_document) :
+        for i, id in enumerate(batch["ids"]) :
+            record = {"id": id, "document": batch["documents"][i], "metadata": batch["metadatas"][i] or {}}
+            if embeddings :
+                record["embedding"] = [float(x) for x in batch["embeddings"][i]]
+            yield record
+
+
+def collection_stats(collection, *, batch_size:int = BATCH_SIZE) -> dict:
+    """
+    Statistiques de la collection en un seul passage.
+
+    Returns:
+        Un dictionnaire avec le nombre de chunks, leur nombre par Livre (et par
+        type), les statistiques des normes des vecteurs (min, moyenne, écart
+        type, max, nombre de vecteurs nuls), leur dimension et les doublons de
+        contenu (paires (id du 1er chunk, id du doublon)).
+    """
+    nb_chunks, nb_duplicates = 0, 0
+    livres, types = Counter(), Counter()
+    livre_titres = {}
+    norms = {"min": float("inf"), "max": 0.0, "sum": 0.0, "sum_squares": 0.0, "nb_zero": 0}
+    dimensions = Counter()
+    first_ids : dict[bytes, str] = {}
+    duplicates = []
+    for batch in iter_collection(collection, batch_size=batch_size, include=["documents", "metadatas", "embeddings"]) :
+        nb_chunks += len(batch["ids"])
+
+        # 1 - Répartition par Livre et par type de chunk
+        for metadata in batch["metadatas"] :
+            metadata = metadata or {}
+            livre = metadata.get("livre_numero", "(aucun)")
+            livres[livre] += 1
+            livre_titres.setdefault(livre, metadata.get("livre_titre", ""))
+            types[metadata.get("type", "(aucun)")] += 1
+
+        # 2 - Normes des vecteurs
+        if batch["embeddings"] is not None and len(batch["embeddings"]) :
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            dimensions[vectors.shape[1]] += len(vectors)
+            batch_norms = np.linalg.norm(vectors, axis=1)
+            norms["min"] = min(norms["min"], float(batch_norms.min()))
+            norms["max"] = max(norms["max"], float(batch_norms.max()))
+            norms["sum"] += float(batch_norms.sum())
+            norms["sum_squares"] += float((batch_norms ** 2).sum())
+            norms["nb_zero"] += int((batch_norms == 0).sum())
+
+        # 3 - Doublons de contenu
+        for id, document in zip(batch["ids"], batch["documents"]) :
+            digest = content_digest(document or "")
+            first_id = first_ids.setdefault(digest, id)
+            if first_id != id :
+                nb_duplicates += 1
+                if len(duplicates) < MAX_DUPLICATES_SHOWN :
+                    duplicates.append((first_id, id))
+
+    nb_vectors = sum(dimensions.values())
+    mean = norms["sum"] / nb_vectors if nb_vectors else 0.0
+    return {
+        "nb_chunks": nb_chunks,
+        "livres": {livre: {"titre": livre_titres[livre], "nb_chunks": nb} for livre, nb in sorted(livres.items())},
+        "types": dict(types),
+        "dimensions": dict(dimensions),
+        "norms": {
+            "min": norms["min"] if nb_vectors else 0.0,
+            "mean": mean,
+            "std": float(np.sqrt(max(0.0, norms["sum_squares"] / nb_vectors - mean ** 2))) if nb_vectors else 0.0,
+            "max": norms["max"],
+            "nb_zero": norms["nb_zero"],
+        },
+        "nb_duplicates": nb_duplicates,
+        "duplicates": duplicates,
+    }
+
+
+def export_jsonl(collection, path:str, **kwargs) -> int:
+    """Écrit les chunks de la collection dans un fichier JSONL (un chunk par ligne), renvoie le nombre de chunks"""
+    nb = 0
+    with open(path, "w", encoding="utf-8") as f :
+        for record in iter_records(collection, **kwargs) :
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            nb += 1
+    return nb
+
+
+def export_parquet(collection, path:str, *, batch_size:int = BATCH_SIZE, embeddings:bool = False, **kwargs) -> int:
+    """
+    Écrit les chunks de la collection dans un fichier Parquet, un groupe de
+    lignes par paquet. Les métadonnées (dont les clés varient d'un chunk à
+    l'autre) sont gardées en JSON dans la colonne metadata.
+    """
+    try :
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError :
+        raise ImportError("L'export Parquet a besoin du package pyarrow (pip install pyarrow), sinon exporter en .jsonl")
+
+    fields = [("id", pa.string()), ("document", pa.string()), ("metadata", pa.string())]
+    if embeddings :
+        fields.append(("embedding", pa.list_(pa.float32())))
+    schema = pa.schema(fields)
+
+    nb = 0
+    rows = []
+    with pq.ParquetWriter(path, schema) as writer :
+        for record in iter_records(collection, batch_size=batch_size, embeddings=embeddings, **kwargs) :
+            record["metadata"] = json.dumps(record["metadata"], ensure_ascii=False)
+            rows.append(record)
+            if len(rows) == batch_size :
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                nb += len(rows)
+                rows = []
+        if rows :
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            nb += len(rows)
+    return nb
+
+
+def print_record(record:dict, *, max_length:int = 200) -> None:
+    print(f"\nID: {record['id']}")
+    print(f"Métadonnées: {record['metadata']}")
+    print(f"Contenu: {record['document'][:max_length]}...")
+
+
+def print_stats(name:str, stats:dict) -> None:
+    print(f"=== Collection '{name}' : {stats['nb_chunks']} chunks ===")
+    print("\nChunks par Livre :")
+    for livre, values in stats["livres"].items() :
+        print(f"   {livre:<8} {values['nb_chunks']:>6}  {values['titre']}")
+    print(f"\nChunks par type : {stats['types']}")
+    norms = stats["norms"]
+    print(f"\nVecteurs (dimension : nombre) : {stats['dimensions']}")
+    print(f"Normes : min={norms['min']:.4f}  moyenne={norms['mean']:.4f}  écart type={norms['std']:.4f}  max={norms['max']:.4f}  nuls={norms['nb_zero']}")
+    print(f"\nDoublons de contenu : {stats['nb_duplicates']}")
+    for first_id, id in stats["duplicates"] :
+        print(f"   {id} == {first_id}")
+
+
+def parse_args(argv:list[str]|None = None) -> argparse.Namespace:
+    # Options communes à toutes les commandes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=CHROMA_DB_PATH, help="dossier de la base Chroma")
+    common.add_argument("--collection", default=COLLECTION_NAME, help="collection à explorer")
+    common.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="nombre de chunks lus à la fois")
+
+    parser = argparse.ArgumentParser(description="Exploration et export de la base de donnée (RAG), sans requête API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("collections", parents=[common], help="liste les collections et leur nombre de vecteurs")
+
+    show = commands.add_parser("show", parents=[common], help="affiche les premiers chunks")
+    show.add_argument("--limit", type=int, default=3)
+
+    commands.add_parser("stats", parents=[common], help="chunks par Livre, normes des vecteurs, doublons de contenu")
+
+    # Filtres communs à query et export
+    filters = argparse.ArgumentParser(add_help=False, parents=[common])
+    filters.add_argument("--where", type=json.loads, default=None, help='filtre Chroma sur les métadonnées (JSON), par ex. \'{"livre_numero": "II"}\'')
+    filters.add_argument("--contains", default=None, help="texte que le contenu des chunks doit contenir")
+
+    query = commands.add_parser("query", parents=[filters], help="chunks dont les métadonnées / le contenu correspondent aux filtres")
+    query.add_argument("--limit", type=int, default=10, help="nombre de chunks affichés")
+    query.add_argument("--count", action="store_true", help="compte tous les chunks trouvés (parcourt toute la collection)")
+
+    export = commands.add_parser("export", parents=[filters], help="exporte les chunks en JSONL ou Parquet (selon l'extension)")
+    export.add_argument("path", help="fichier de sortie (.jsonl ou .parquet)")
+    export.add_argument("--embeddings", action="store_true", help="exporte aussi les vecteurs")
+    return parser.parse_args(argv)
+
+
+def main(argv:list[str]|None = None) -> None:
+    args = parse_args(argv)
+    client = chromadb.PersistentClient(path=args.db)
+
+    if args.command == "collections" :
+        for collection in client.list_collections() :
+            name = getattr(collection, "name", collection)
+            print(f"{name:<40} {client.get_collection(name).count():>8} vecteurs")
+        return
+
+    collection = client.get_collection(args.collection)
+
+    if args.command == "show" :
+        print(f"Nombre de vecteurs dans la collection '{args.collection}' : {collection.count()}")
+        records = iter_records(collection, batch_size=min(args.batch_size, args.limit))
+        for _, record in zip(range(args.limit), records) :
+            print_record(record)
+
+    elif args.command == "stats" :
+        print_stats(args.collection, collection_stats(collection, batch_size=args.batch_size))
+
+    elif args.command == "query" :
+        where_document = {"$contains": args.contains} if args.contains else None
+        nb = 0
+        for record in iter_records(collection, batch_size=args.batch_size, where=args.where, where_document=where_document) :
+            if nb < args.limit :
+                print_record(record)
+            nb += 1
+            if nb >= args.limit and not args.count :
+                break
+        print(f"\nChunks trouvés : {nb}" + ("" if args.count else f" (au plus --limit={args.limit}, --count pour tout compter)"))
+
+    elif args.command == "export" :
+        where_document = {"$contains": args.contains} if args.contains else None
+        export = export_parquet if args.path.endswith(".parquet") else export_jsonl
+        try :
+            nb = export(collection, args.path, batch_size=args.batch_size, embeddings=args.embeddings, where=args.where, where_document=where_document)
+        except ImportError as e :
+            sys.exit(f"⚠️  {e}")
+        print(f"{nb} chunks exportés dans {args.path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,13 +3,16 @@
 # Date   : 2025-09-09
 import os
 import getpass
-import time
 from tqdm import tqdm
 
 from mytools import setup_env_variables, load_QA, create_file_if_not_exists
 from chunker import chunk_code_penal
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from embeddings import make_embeddings, collection_metadata, collection_dimension, check_dimension
+from provider import configure_provider
 from langchain_chroma import Chroma
+from hierarchical_index import build_chapter_index, chapter_collection_name
+from references import ReferenceGraph, references_path
+from snapshots import publish_snapshot
 
 # Si on veut juste tester ce script on mets CHUNK_LIMIT_FOR_TEST=True
 # Si on veut charger tous les chunks on mets CHUNK_LIMIT_FOR_TEST=False
@@ -18,9 +21,19 @@ CHUNK_LIMIT_FOR_TEST = True
 # Mais attention ! Pour remplir en entier la base de donnée, cela va probablement consommer
 # tous les quotats gratuits de la journée ! 
 
-# On a 100 requete par minutes max sur l'API Google
+# On a 100 requete par minutes max sur l'API Google : le client commun du
+# fournisseur (provider.py) étale les requêtes et réessaie en cas de quota
 RPM_LIMIT = 100
-NAP_DURATION = 61 # secondes
+configure_provider(requests_per_minute=RPM_LIMIT - 5)
+
+# Dimension des vecteurs stockés (None pour la dimension complète du modèle).
+# gemini-embedding-001 supporte la troncature de ses vecteurs (Matryoshka) :
+# on peut par exemple utiliser 768 pour diviser le stockage par 4.
+EMBEDDING_DIMENSION = None
+
+# Publication de la base comme nouvelle version pour le serveur (cf. snapshots.py),
+# pas pour un simple test (sinon le serveur basculerait sur une base incomplète)
+PUBLISH_SNAPSHOT = not CHUNK_LIMIT_FOR_TEST
 
 # Chemin vers le PDF du code pénal
 file_path = "data/Code_penal.pdf"
@@ -31,7 +44,7 @@ print("1 - 🖊️ Gestion de l'environnement.", flush=True)
 setup_env_variables(auto=True, verbose=True)
 
 # Embeddings :
-embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+embeddings = make_embeddings(EMBEDDING_DIMENSION)
 
 # Splits en utilisant le code généré par Claude.ai
 print("2 - ✂️  Chunk du code pénal ...", end=" ", flush=True)
@@ -60,8 +73,14 @@ vector_store = Chroma(
     collection_name="code_penal",
     embedding_function=embeddings,
     persist_directory="./chroma_langchain_db",  # Where to save data locally, remove if not necessary
+    collection_metadata=collection_metadata(EMBEDDING_DIMENSION),
 )
 
+# Une collection existante garde la dimension de sa création : on s'arrête tout
+# de suite (plutôt qu'à chaque ajout, pris ensuite pour un problème de quota)
+# si EMBEDDING_DIMENSION n'est plus la même
+check_dimension(collection_dimension(vector_store), EMBEDDING_DIMENSION, "La collection 'code_penal' existante")
+
 # Si je ne fait que tester je limite :
 if CHUNK_LIMIT_FOR_TEST:
     liste_articles = liste_articles[0:30]
@@ -73,10 +92,6 @@ try:
         chunk = liste_articles[i]
         # Indexation de chunks dans le RAG
         ids = vector_store.add_documents(documents=[chunk])
-        # On fait des pauses pour ne pas cramer notre compteur API
-        if (i+1)%(RPM_LIMIT-5) == 0:
-            print(f"\nPause après {i+1} documents...")
-            time.sleep(NAP_DURATION)
 except Exception as e:
     print(e)
     print(f"Probablement un problème de quotat ! On en est au chunk numéro {i} !")
@@ -84,8 +99,23 @@ else:
   print("Aucun problème lors de l'embedding !") 
 
 
+# Index hiérarchique (un vecteur par chapitre, sans requête API) :
+print("4 - 🗂️  Index des chapitres ...", end=" ", flush=True)
+chapter_store = Chroma(
+    collection_name=chapter_collection_name("code_penal"),
+    persist_directory="./chroma_langchain_db",
+)
+nb_chapitres = build_chapter_index(vector_store, chapter_store)
+print(f"✅ ({nb_chapitres} chapitres)")
+
+# Graphe des renvois entre articles, sauvegardé avec la collection :
+print("5 - 🔗  Graphe des renvois entre articles ...", end=" ", flush=True)
+graph = ReferenceGraph.from_collection(vector_store)
+graph.save(references_path("./chroma_langchain_db", "code_penal"))
+print(f"✅ ({len(graph)} renvois)")
+
 # Test de l'embedding avec un requêtes simple :
-print("4 - 📤  Test de requête", flush=True)
+print("6 - 📤  Test de requête", flush=True)
 requete = "A qui est applicable le code pénal ?"
 print(f'    On envoie la requête suivante : "{requete}"')
 results = vector_store.similarity_search(requete)
@@ -95,4 +125,10 @@ for i, res in enumerate(results):
     text = "============= chunk " + str(i+1) + " =================="
     print(text)
     print(res)
-    print("="*len(text))
\ No newline at end of file
+    print("="*len(text))
+
+# Nouvelle version de la base pour le serveur (copie immuable, cf. snapshots.py) :
+if PUBLISH_SNAPSHOT :
+    print("7 - 📦  Publication de la nouvelle version de la base ...", end=" ", flush=True)
+    version = publish_snapshot("./chroma_langchain_db")
+    print(f"✅ (version {version})")
@@ -0,0 +1,159 @@
+# -*- coding: utf8 -*-
+#
+# Index hiérarchique en deux étages : un vecteur par chapitre (centroïde des
+# articles du chapitre) permet de sélectionner les chapitres pertinents, puis
+# on ne cherche les articles qu'à l'intérieur de ces chapitres.
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from mytools import iter_collection
+from chunker import chapitre_cle
+from context_builder import hierarchy_header
+
+# Suffixe du nom de la collection qui contient les vecteurs des chapitres
+CHAPTER_COLLECTION_SUFFIX = "__chapitres"
+
+
+def chapter_collection_name(collection_name:str) -> str:
+    """Nom de la collection des chapitres associée à une collection d'articles"""
+    return collection_name + CHAPTER_COLLECTION_SUFFIX
+
+
+def chapter_summary(sections:dict[str, str], nb_articles:int) -> str:
+    """
+    Résumé d'un chapitre, écrit dans le contexte sous son en-tête (cf.
+    inject_chapter_context) : ce que couvre le chapitre au-delà des articles
+    trouvés, c.-à-d. les titres de ses sections. Vide pour un chapitre sans
+    section (son titre est déjà dans l'en-tête).
+    """
+    if not sections :
+        return ""
+    return f"Chapitre de {nb_articles} articles, sections : " + " ; ".join(
+        f"{numero} : {titre}" if titre else numero for numero, titre in sections.items())
+
+
+def build_chapter_index(article_store:Chroma, chapter_store:Chroma, *, batch_size:int = 500) -> int:
+    """
+    Calcule un vecteur résumé par chapitre (moyenne normalisée des vecteurs
+    de ses articles) et l'enregistre dans chapter_store. Aucune requête API
+    n'est faite : on réutilise les vecteurs déjà calculés pour les articles.
+    Les articles indexés avant l'ajout de la métadonnée 'chapitre_cle' sont
+    mis à jour au passage, et les chapitres qui n'existent plus (renommés,
+    supprimés) sont retirés de chapter_store.
+
+    Returns:
+        Le nombre de chapitres indexés
+    """
+    sums : dict[str, np.ndarray] = {}
+    infos : dict[str, dict] = {}
+
+    # 1 - Accumulation des vecteurs des articles par chapitre
+    for batch in iter_collection(article_store._collection, batch_size=batch_size, include=["metadatas", "embeddings"]):
+        ids_to_update, metadatas_to_update = [], []
+        for id_, metadata, embedding in zip(batch["ids"], batch["metadatas"], batch["embeddings"]):
+            cle = metadata.get("chapitre_cle") or chapitre_cle(metadata)
+            if cle is None :
+                continue
+            if "chapitre_cle" not in metadata :
+                ids_to_update.append(id_)
+                metadatas_to_update.append({**metadata, "chapitre_cle": cle})
+            vector = np.asarray(embedding, dtype=np.float32)
+            if cle not in sums :
+                sums[cle] = np.zeros_like(vector)
+                infos[cle] = {"metadata": metadata, "articles": [], "sections": {}}
+            sums[cle] += vector / (np.linalg.norm(vector) or 1.0)
+            info = infos[cle]
+            info["articles"].append(metadata.get("article_numero", "?"))
+            # Les articles sont parcourus dans l'ordre de l'ingestion (celui du code)
+            if metadata.get("section_numero") :
+                info["sections"].setdefault(metadata["section_numero"], metadata.get("section_titre", ""))
+        if ids_to_update :
+            article_store._collection.update(ids=ids_to_update, metadatas=metadatas_to_update)
+
+    # 2 - Un document par chapitre : en-tête + résumé (sections), et le centroïde comme vecteur
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for cle, total in sums.items():
+        info = infos[cle]
+        metadata = info["metadata"]
+        summary = chapter_summary(info["sections"], len(info["articles"]))
+        centroid = total / (np.linalg.norm(total) or 1.0)
+        ids.append(cle)
+        documents.append("\n".join(filter(None, [hierarchy_header({k: v for k, v in metadata.items() if not k.startswith('section')}), summary])))
+        chapter_metadata = {k: v for k, v in metadata.items() if k.split("_")[0] in ("livre", "titre", "chapitre")}
+        chapter_metadata["chapitre_cle"] = cle
+        chapter_metadata["chapitre_resume"] = summary
+        chapter_metadata["nb_articles"] = len(info["articles"])
+        metadatas.append(chapter_metadata)
+        embeddings.append(centroid.tolist())
+    if ids :
+        chapter_store._collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    # 3 - Suppression des chapitres d'une construction précédente qui n'existent plus
+    kept = set(ids)
+    stale = [id_ for batch in iter_collection(chapter_store._collection, batch_size=batch_size, include=[])
+             for id_ in batch["ids"] if id_ not in kept]
+    if stale :
+        chapter_store._collection.delete(ids=stale)
+    return len(ids)
+
+
+class HierarchicalRetriever :
+    """
+    Recherche en deux étages : on sélectionne d'abord les nb_chapitres
+    chapitres les plus proches de la requête, puis les articles les plus
+    proches parmi ceux de ces chapitres uniquement. Les articles sans
+    métadonnée 'chapitre_cle' (hors de tout chapitre) ne sont donc jamais
+    trouvés par cette recherche.
+    """
+
+    def __init__(self, *, article_store:Chroma, chapter_store:Chroma, embeddings, nb_chapitres:int = 5) -> None:
+        self._article_store = article_store
+        self._chapter_store = chapter_store
+        self._embeddings = embeddings
+        self._nb_chapitres = nb_chapitres
+
+    def is_available(self) -> bool:
+        """Vrai si l'index des chapitres a été construit (cf. build_hierarchy.py)"""
+        return self._chapter_store._collection.count() > 0
+
+    def search(self, query:str, k:int, *, embedding:list[float]|None = None, chapitres:list[str]|None = None,
+               where:dict|None = None) -> tuple[list[tuple[Document, float]], list[Document]]:
+        """
+        Args:
+            embedding: vecteur de la requête, s'il est déjà calculé
+            chapitres: si précisé, on ne choisit que parmi ces chapitres (clés 'chapitre_cle') ;
+                aucun résultat si la liste est vide
+            where: filtre Chroma supplémentaire sur les articles
+
+        Returns:
+            Les k articles les plus pertinents avec leur score de pertinence,
+            et les documents des chapitres sélectionnés.
+        """
+        if chapitres is not None and not chapitres :
+            return [], []
+        if embedding is None :
+            embedding = self._embeddings.embed_query(query)
+
+        # 1 - Premier étage : sélection des chapitres
+        chapter_filter = {"chapitre_cle": {"$in": chapitres}} if chapitres is not None else None
+        chapters = self._with_relevance(self._chapter_store,
+            self._chapter_store.similarity_search_by_vector_with_relevance_scores(embedding, k=self._nb_chapitres, filter=chapter_filter))
+        cles = [doc.metadata["chapitre_cle"] for doc, _ in chapters]
+        if not cles :
+            return [], []
+
+        # 2 - Second étage : recherche des articles dans ces chapitres seulement
+        article_filter = {"chapitre_cle": {"$in": cles}}
+        if where is not None :
+            article_filter = {"$and": [article_filter, where]}
+        articles = self._with_relevance(self._article_store,
+            self._article_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=article_filter))
+        return articles, [doc for doc, _ in chapters]
+
+    @staticmethod
+    def _with_relevance(store:Chroma, results:list[tuple[Document, float]]) -> list[tuple[Document, float]]:
+        """Convertit les distances renvoyées par Chroma en scores de pertinence"""
+        relevance = store._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in results]
@@ -6,18 +6,35 @@ Debugger: Jérome Delaunay et Thomas Mari
 Date: September 11, 2025
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Union
+from collections import OrderedDict
+import asyncio
+import datetime
+import json
 import uvicorn
 import os
-from starlette.responses import FileResponse
+import gzip
+import hashlib
 
 # Import your AIExpertLawyer class
 from aiexpertlawyer import AIExpertLawyer
+from singleflight import SingleFlight
+from router import ModelRouter
+from aijudge import AIJudge
+from provider import AdmissionQueue, QuotaExceededError, ServerOverloadedError, get_provider, nb_shared_clients
+from mytools import normalize_question
+from sessions import Session, SessionStore
+from answer_store import AnswerStore
+from metadata_index import check_scope
+from compression import CompressionMiddleware
+from snapshots import current_snapshot, snapshot_path
+from prompt_registry import InvalidPromptError
 
 # Pydantic models for request/response
 class QuestionRequest(BaseModel):
@@ -25,16 +42,25 @@ class QuestionRequest(BaseModel):
     temperature: Optional[float] = 0.3
     top_p: Optional[float] = 0.8
     nb_chunk: Optional[int] = 4
+    # Conversation: None for a standalone question, "" to start a new session,
+    # or the session_id returned by a previous answer to ask a follow-up
+    session_id: Optional[str] = None
+    # Restrict the search to some articles, e.g. {"livre": "II"} or {"loi": "2021-*"}
+    # (fields: livre, titre, chapitre, section, chapitre_cle, loi, ordonnance, article)
+    scope: Optional[dict[str, Union[str, list[str]]]] = None
 
 class QuestionResponse(BaseModel):
     question: str
     answer: str
     status: str
+    tier: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ConfigRequest(BaseModel):
     system_prompt: Optional[str] = None
     chroma_collection_name: str = "code_penal"
-    chroma_db_path: str = "./chroma_langchain_db"
+    # None: keep the index in service (current snapshot, cf. /reload)
+    chroma_db_path: Optional[str] = None
     llm_model: str = "gemini-2.5-flash-lite"
     temperature: float = 0.3
     top_p: float = 0.8
@@ -56,89 +82,415 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses (brotli if brotli-asgi is installed and accepted by the client, gzip otherwise).
+# The token stream is left uncompressed so that each token is sent as soon as it is generated.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=500,
+    exclude_paths=("/ask/stream",),
+)
+
+class ReloadRequest(BaseModel):
+    # Snapshot to load (None: the CURRENT one, cf. snapshots.py)
+    version: Optional[str] = None
+
 # Global variable to store the AI expert instance
 ai_expert: Optional[AIExpertLawyer] = None
 
+# Parameters of the default expert (changed by /configure, kept when the index is swapped)
+expert_config: dict = {"chroma_collection_name": "code_penal", "temperature": 0.3, "nb_chunk": 4, "top_p": 0.8}
+
+# Index in service: the CURRENT snapshot if there is one (cf. snapshots.py), else the ingestion database.
+# A new index is loaded and warmed up in the background, then swapped in at once.
+DEFAULT_DB_PATH = "./chroma_langchain_db"
+SNAPSHOT_POLL_SECONDS = float(os.environ.get("SNAPSHOT_POLL_SECONDS", 0))
+index_state = {"snapshot": None, "db_path": DEFAULT_DB_PATH, "loading": None, "last_swap": None, "error": None}
+swap_lock = asyncio.Lock()
+snapshot_watcher: Optional[asyncio.Task] = None
+
+# Variants of the default expert for requests with other generation parameters (cf. expert_for):
+# (temperature, top_p, nb_chunk) -> (default expert they derive from, variant), least recently used first
+CUSTOM_EXPERTS_MAX = int(os.environ.get("CUSTOM_EXPERTS_MAX", 16))
+custom_experts: "OrderedDict[tuple, tuple[AIExpertLawyer, AIExpertLawyer]]" = OrderedDict()
+
+def expert_options() -> dict:
+    """Server-wide AIExpertLawyer options read from the environment (cf. .env.example)"""
+    return {
+        "prompt_cache": os.environ.get("PROMPT_CACHE", "local"),
+        "rerank": os.environ.get("RERANK") or None,
+        "local_index": os.environ.get("LOCAL_INDEX", "false").lower() == "true",
+        "coarse_dim": int(os.environ["COARSE_DIM"]) if os.environ.get("COARSE_DIM") else None
+    }
+
+# Identical questions asked concurrently share a single computation
+singleflight = SingleFlight()
+
+# Bounded admission queue: beyond it, requests get a 503 instead of piling up
+admission = AdmissionQueue(
+    max_in_flight=int(os.environ.get("SERVER_MAX_IN_FLIGHT", 8)),
+    max_waiting=int(os.environ.get("SERVER_MAX_WAITING", 32))
+)
+
+def unavailable(error: QuotaExceededError | ServerOverloadedError) -> HTTPException:
+    """503 response telling the client when to retry"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(int(error.retry_after))}
+    )
+
+# Optional model routing cascade (template answer / cheap model / strong model)
+router: Optional[ModelRouter] = None
+
+# Conversation sessions (history + reusable retrieved chunks), bounded LRU
+sessions = SessionStore(
+    max_sessions=int(os.environ.get("SESSIONS_MAX", 1000)),
+    max_bytes=int(os.environ.get("SESSIONS_MAX_BYTES", 50_000_000))
+)
+
+# Precomputed answers for frequent questions (cf. precompute_answers.py), if the store exists
+ANSWER_STORE_PATH = os.environ.get("ANSWER_STORE", "data/answers.sqlite")
+answer_store: Optional[AnswerStore] = None
+
+def build_expert(db_path: str, config: dict) -> AIExpertLawyer:
+    """Build (blocking) an expert on the index db_path and warm it up before it is put in service"""
+    expert = AIExpertLawyer(chroma_db_path=db_path, **config, **expert_options(), logfile="logs/ai_expert_app.log")
+    expert.warm_up()
+    return expert
+
+async def swap_expert(db_path: str, config: dict, snapshot: Optional[str] = None) -> AIExpertLawyer:
+    """
+    Build the new default expert in a worker thread (requests are still answered by the
+    current one meanwhile), then swap it in. In-flight requests finish with the expert they started with.
+    """
+    global ai_expert
+    async with swap_lock:
+        index_state["loading"] = snapshot or db_path
+        try:
+            expert = await run_in_threadpool(build_expert, db_path, config)
+        except Exception as e:
+            index_state["error"] = str(e)
+            raise
+        finally:
+            index_state["loading"] = None
+        ai_expert = expert
+        # Variants of the previous expert still point to the previous index / prompt
+        custom_experts.clear()
+        expert_config.clear()
+        expert_config.update(config)
+        index_state.update(snapshot=snapshot, db_path=db_path, error=None,
+                           last_swap=datetime.datetime.now().isoformat(timespec="seconds"))
+        if answer_store is not None:
+            # Answers computed on another index or with another prompt are outdated
+            await run_in_threadpool(answer_store.purge, **expert.answer_versions())
+        return expert
+
+async def reload_snapshot(version: str):
+    """Swap in the snapshot version (background task: errors are reported by /health)"""
+    try:
+        await swap_expert(snapshot_path(version), dict(expert_config), version)
+        print(f"Index snapshot {version} in service")
+    except Exception as e:
+        print(f"Error loading index snapshot {version}: {e}")
+
+async def watch_snapshots():
+    """Swap in each new snapshot published by the ingestion (CURRENT changed), every SNAPSHOT_POLL_SECONDS"""
+    seen = current_snapshot()
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        version = await run_in_threadpool(current_snapshot)
+        if version is not None and version != seen:
+            seen = version
+            await reload_snapshot(version)
+
+def precomputed_answer(expert: AIExpertLawyer, question: str, session: Optional[Session], scope: Optional[dict] = None) -> Optional[str]:
+    """
+    Precomputed answer (blocking), only for unscoped standalone questions or the first question of a
+    session, asked to the expert in service: the answers were computed with its parameters, not a variant's
+    """
+    if answer_store is None or expert is not ai_expert or scope or (session is not None and session.turns):
+        return None
+    answer = answer_store.get(question, **expert.answer_versions())
+    if answer is not None and session is not None:
+        session.add_turn(question, answer)
+    return answer
+
+def ask_in_session(expert: AIExpertLawyer, question: str, session: Optional[Session], scope: Optional[dict] = None) -> tuple[str, Optional[str]]:
+    """Answer (blocking) a question, one question at a time per session (returns the answer and the routing tier)"""
+    if session is None:
+        return (expert.ask(question, scope=scope), None) if router is None else router.route(expert, question, scope=scope)
+    with session.lock:
+        if router is None:
+            answer, tier = expert.ask(question, session, scope), None
+        else:
+            answer, tier = router.route(expert, question, session, scope)
+    sessions.touch()
+    return answer, tier
+
+def stream_in_session(expert: AIExpertLawyer, question: str, session: Optional[Session], scope: Optional[dict] = None):
+    """Token stream of the answer, one question at a time per session"""
+    if session is None:
+        yield from expert.ask_stream(question, scope=scope)
+        return
+    with session.lock:
+        yield from expert.ask_stream(question, session, scope)
+    sessions.touch()
+
+async def admitted_ask(expert: AIExpertLawyer, question: str, session: Optional[Session] = None, scope: Optional[dict] = None) -> tuple[str, Optional[str]]:
+    """Answer in a worker thread once admitted by the admission queue (returns the answer and the routing tier)"""
+    async with admission.admit():
+        return await run_in_threadpool(ask_in_session, expert, question, session, scope)
+
+def session_for(request: QuestionRequest) -> Optional[Session]:
+    """Conversation session of a request (None for a standalone question)"""
+    if request.session_id is None:
+        return None
+    return sessions.get_or_create(request.session_id)
+
+def coalescing_key(request: QuestionRequest, session: Optional[Session] = None) -> str:
+    """Key identifying identical questions (normalised question + generation parameters + scope + conversation)"""
+    key = f"{normalize_question(request.question)}|{request.temperature}|{request.top_p}|{request.nb_chunk}"
+    if request.scope:
+        key += "|" + json.dumps(request.scope, sort_keys=True)
+    return key if session is None else f"{key}|{session.session_id}"
+
+def custom_parameters(request: QuestionRequest) -> bool:
+    """True if the request asks for other generation parameters than the default expert's (cf. /configure)"""
+    return ((request.temperature, request.top_p, request.nb_chunk) !=
+            (expert_config["temperature"], expert_config["top_p"], expert_config["nb_chunk"]))
+
+async def expert_for(request: QuestionRequest) -> AIExpertLawyer:
+    """
+    Return the AI expert to use for a request: the default expert, or its variant with the request's
+    generation parameters. Variants share the default expert's index and are cached (bounded LRU);
+    the default expert itself is only ever replaced by swap_expert.
+    """
+    expert = ai_expert
+    if expert is None:
+        raise HTTPException(status_code=500, detail="AI Expert not initialized")
+
+    try:
+        check_scope(request.scope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not custom_parameters(request):
+        return expert
+    key = (request.temperature, request.top_p, request.nb_chunk)
+    cached = custom_experts.get(key)
+    if cached is not None and cached[0] is expert:
+        custom_experts.move_to_end(key)
+        return cached[1]
+    variant = await run_in_threadpool(expert.with_parameters, temperature=request.temperature,
+                                      top_p=request.top_p, nb_chunk=request.nb_chunk)
+    # Not cached if the default expert was swapped meanwhile (the variant still answers this request)
+    if expert is ai_expert:
+        custom_experts[key] = (expert, variant)
+        while len(custom_experts) > CUSTOM_EXPERTS_MAX:
+            custom_experts.popitem(last=False)
+    return variant
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the AI Expert Lawyer on startup"""
-    global ai_expert
+    global router, answer_store, snapshot_watcher
     try:
-        ai_expert = AIExpertLawyer(
-            temperature=0.3,
-            nb_chunk=4,
-            top_p=0.8,
-            logfile="logs/ai_expert_app.log"
-        )
-        print("AI Expert Lawyer initialized successfully!")
+        snapshot = current_snapshot()
+        await swap_expert(snapshot_path(snapshot) if snapshot else DEFAULT_DB_PATH, dict(expert_config), snapshot)
+        print(f"AI Expert Lawyer initialized successfully! (index snapshot: {snapshot})")
+        if SNAPSHOT_POLL_SECONDS > 0:
+            snapshot_watcher = asyncio.create_task(watch_snapshots())
+        if os.path.exists(ANSWER_STORE_PATH):
+            answer_store = AnswerStore(ANSWER_STORE_PATH)
+            nb_purged = answer_store.purge(**ai_expert.answer_versions())
+            print(f"Precomputed answers: {len(answer_store)} ({nb_purged} outdated removed)")
+        if os.environ.get("ROUTING", "false").lower() == "true":
+            judge = None
+            if os.environ.get("ROUTER_USE_JUDGE", "false").lower() == "true":
+                judge = AIJudge(verbose=False, logfile="logs/ai_judge_app.log")
+            router = ModelRouter(
+                strong_llm_model=os.environ.get("ROUTER_STRONG_MODEL", "gemini-2.5-flash"),
+                judge=judge,
+                require_citation=os.environ.get("ROUTER_REQUIRE_CITATION", "false").lower() == "true"
+            )
+            print("Model routing enabled!")
     except Exception as e:
         print(f"Error initializing AI Expert Lawyer: {e}")
 
+# Web interface, kept in memory with its gzip version and its ETag (reloaded when the file changes)
+INDEX_HTML_PATH = "./interface/index.html"
+index_html = {"mtime": None, "content": b"", "gzip": b"", "etag": ""}
+
+def load_index_html() -> dict:
+    mtime = os.path.getmtime(INDEX_HTML_PATH)
+    if index_html["mtime"] != mtime:
+        with open(INDEX_HTML_PATH, "rb") as f:
+            content = f.read()
+        index_html.update(mtime=mtime, content=content, gzip=gzip.compress(content, compresslevel=9),
+                          etag=f'"{hashlib.sha256(content).hexdigest()[:16]}"')
+    return index_html
+
 @app.get("/", response_class=HTMLResponse)
-async def get_web_interface():
-    """Serve the web interface"""
-    html_content = FileResponse("./interface/index.html")
-    return html_content
+async def get_web_interface(http_request: Request):
+    """Serve the web interface (304 Not Modified if the browser already has this version)"""
+    page = load_index_html()
+    # no-cache: the browser keeps the page but revalidates it with its ETag on each visit
+    headers = {"ETag": page["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if http_request.headers.get("if-none-match") == page["etag"]:
+        return Response(status_code=304, headers=headers)
+    # Compressed once per version of the file rather than by the middleware on each request
+    if "gzip" in http_request.headers.get("accept-encoding", ""):
+        return HTMLResponse(page["gzip"], headers={**headers, "Content-Encoding": "gzip"})
+    return HTMLResponse(page["content"], headers=headers)
 
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """Ask a question to the AI expert"""
-    global ai_expert
-    
-    if ai_expert is None:
-        raise HTTPException(status_code=500, detail="AI Expert not initialized")
+    expert = await expert_for(request)
+    session = session_for(request)
     
     try:
-        # Update AI expert parameters if they differ from current settings
-        if (request.temperature != 0.3 or 
-            request.top_p != 0.8 or 
-            request.nb_chunk != 4):
-            
-            ai_expert = AIExpertLawyer(
-                temperature=request.temperature,
-                top_p=request.top_p,
-                nb_chunk=request.nb_chunk
+        # Frequent questions are answered instantly from the precomputed answers
+        answer = await run_in_threadpool(precomputed_answer, expert, request.question, session, request.scope)
+        if answer is not None:
+            return QuestionResponse(
+                question=request.question,
+                answer=answer,
+                status="success",
+                tier="precomputed",
+                session_id=session.session_id if session is not None else None
             )
-        
-        # Get the answer
-        answer = ai_expert.ask(request.question)
+
+        # Get the answer (in a worker thread, shared with identical in-flight questions)
+        answer, tier = await singleflight.do(
+            coalescing_key(request, session),
+            lambda: admitted_ask(expert, request.question, session, request.scope)
+        )
         
         return QuestionResponse(
             question=request.question,
             answer=answer,
-            status="success"
+            status="success",
+            tier=tier,
+            session_id=session.session_id if session is not None else None
         )
     
+    except (QuotaExceededError, ServerOverloadedError) as e:
+        raise unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """Ask a question to the AI expert and stream the answer as it is generated"""
+    expert = await expert_for(request)
+    session = session_for(request)
+    headers = {"X-Session-Id": session.session_id} if session is not None else None
+
+    answer = await run_in_threadpool(precomputed_answer, expert, request.question, session, request.scope)
+    if answer is not None:
+        return StreamingResponse(iter([answer]), media_type="text/plain; charset=utf-8", headers=headers)
+
+    # Rejected up front while the status can still be a 503
+    if admission.is_full():
+        admission.nb_rejected += 1
+        raise unavailable(ServerOverloadedError(admission.retry_after()))
+
+    async def admitted_stream():
+        # Identical in-flight questions receive the same token stream. As for /ask, only its
+        # producer takes an admission slot, once the body is being sent (if the client is gone
+        # before that, nothing was started), and holds it for the whole stream
+        async for chunk in singleflight.stream(
+            coalescing_key(request, session),
+            lambda: stream_in_session(expert, request.question, session, request.scope),
+            admit=admission.admit
+        ):
+            yield chunk
+
+    return StreamingResponse(admitted_stream(), media_type="text/plain; charset=utf-8", headers=headers)
+
+# Speculative retrieval while the user is typing: shorter texts are not worth a search
+PREFETCH_MIN_LENGTH = int(os.environ.get("PREFETCH_MIN_LENGTH", 10))
+
+@app.post("/prefetch", status_code=202)
+async def prefetch_question(request: QuestionRequest, background_tasks: BackgroundTasks):
+    """
+    Start the retrieval (embedding + search) for a question being typed, called debounced by
+    the web page: when the question is sent to /ask, only the LLM call remains.
+    """
+    if ai_expert is None or len(request.question.strip()) < PREFETCH_MIN_LENGTH:
+        return {"status": "skipped"}
+    # Same expert (or variant) as /ask will use for these parameters
+    expert = await expert_for(request)
+    # Speculative work never competes with actual questions
+    if admission.is_busy():
+        return {"status": "skipped"}
+    background_tasks.add_task(run_in_threadpool, expert.prefetch, request.question, sessions.get(request.session_id), request.scope)
+    return {"status": "prefetching"}
+
 @app.post("/configure")
 async def configure_expert(request: ConfigRequest):
-    """Configure the AI expert with new settings"""
-    global ai_expert
-    
+    """Configure the AI expert with new settings (requests are served by the previous expert until it is ready)"""
+    config = {
+        "system_prompt": request.system_prompt,
+        "chroma_collection_name": request.chroma_collection_name,
+        "llm_model": request.llm_model,
+        "temperature": request.temperature,
+        "top_p": request.top_p,
+        "nb_chunk": request.nb_chunk
+    }
+    if request.chroma_db_path is None:
+        db_path, snapshot = index_state["db_path"], index_state["snapshot"]
+    else:
+        db_path, snapshot = request.chroma_db_path, None
+
     try:
-        ai_expert = AIExpertLawyer(
-            system_prompt=request.system_prompt,
-            chroma_collection_name=request.chroma_collection_name,
-            chroma_db_path=request.chroma_db_path,
-            llm_model=request.llm_model,
-            temperature=request.temperature,
-            top_p=request.top_p,
-            nb_chunk=request.nb_chunk
-        )
-        
+        await swap_expert(db_path, config, snapshot)
         return {"status": "success", "message": "AI Expert reconfigured successfully"}
     
+    except InvalidPromptError as e:
+        # Rejected before any API call, the current expert stays in service
+        raise HTTPException(status_code=400, detail=f"Invalid system prompt: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error configuring AI expert: {str(e)}")
 
+@app.post("/reload", status_code=202)
+async def reload_index(background_tasks: BackgroundTasks, request: Optional[ReloadRequest] = None):
+    """Load an index snapshot (default: the CURRENT one) in the background and swap it in when it is warmed up"""
+    version = (request.version if request is not None else None) or current_snapshot()
+    if version is None or not os.path.isdir(snapshot_path(version)):
+        raise HTTPException(status_code=404, detail=f"Index snapshot not found: {version}")
+    if index_state["loading"] is not None:
+        raise HTTPException(status_code=409, detail=f"Already loading {index_state['loading']}")
+    if version == index_state["snapshot"]:
+        return {"status": "unchanged", "snapshot": version}
+    background_tasks.add_task(reload_snapshot, version)
+    return {"status": "loading", "snapshot": version}
+
+@app.get("/stats/routing")
+async def routing_stats():
+    """Number of answers, latency and estimated cost per routing tier"""
+    if router is None:
+        return {"routing": False}
+    return {"routing": True, "tiers": router.report()}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "ai_expert_initialized": ai_expert is not None
+        "ai_expert_initialized": ai_expert is not None,
+        "coalesced_requests": singleflight.nb_coalesced,
+        "rejected_requests": admission.nb_rejected,
+        "sessions": len(sessions),
+        "custom_experts": len(custom_experts),
+        "provider": get_provider().stats,
+        "shared_clients": nb_shared_clients(),
+        "index": index_state,
+        "prefetch": ai_expert.get_prefetch_stats() if ai_expert is not None else None,
+        "precomputed_answers": answer_store.stats if answer_store is not None else None,
+        "prompt": ai_expert.get_prompt_template().report() if ai_expert is not None else None,
+        "prompt_cache": ai_expert.get_prompt_cache_stats() if ai_expert is not None else None
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+# -*- coding: utf8 -*-
+#
+# Index vectoriel local (numpy) exporté depuis une collection Chroma, avec un
+# format compact optionnel : vecteurs quantifiés en int8 pour le parcours de
+# toute la base, et vecteurs float16 (lus à la demande, en mmap) pour
+# re-classer les meilleurs candidats. Le parcours peut aussi ne porter que sur
+# les premières composantes des vecteurs (troncature "Matryoshka").
+
+import json
+import os
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from mytools import iter_collection
+
+# Suffixe du dossier des index locaux, à côté du dossier Chroma (pas dedans : la
+# base Chroma est copiée telle quelle, dans l'image Docker par ex., et n'a pas à
+# grossir d'un index qui ne sert que si on l'active)
+LOCAL_INDEX_SUFFIX = "_local"
+
+# Nombre de lignes traitées à la fois lors du parcours approché
+# (pour ne pas convertir toute la matrice en float32 d'un coup)
+SCAN_BLOCK_SIZE = 4096
+
+
+def local_index_path(persist_directory:str, collection_name:str) -> str:
+    """Dossier de l'index local d'une collection (par ex. chroma_langchain_db_local/code_penal)"""
+    return os.path.join(local_indexes_dir(persist_directory), collection_name)
+
+
+def local_indexes_dir(persist_directory:str) -> str:
+    """Dossier des index locaux des collections d'une base Chroma"""
+    return os.path.normpath(persist_directory) + LOCAL_INDEX_SUFFIX
+
+
+def quantize_int8(vectors:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantification symétrique int8, avec un facteur d'échelle par vecteur :
+    vectors ≈ codes * scales[:, None]
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class LocalVectorIndex :
+    """
+    Index vectoriel local. Les vecteurs sont normalisés : le score renvoyé est
+    la similarité cosinus (plus il est grand, mieux c'est).
+      - sans quantification ni coarse_dim, la recherche est exacte en float32,
+      - sinon on parcourt toute la base avec une approximation (codes int8
+        et/ou coarse_dim premières composantes seulement) puis on re-classe
+        rerank_factor * k candidats avec les vecteurs complets.
+    """
+
+    def __init__(self, *, ids:list[str], documents:list[str], metadatas:list[dict], vectors:np.ndarray,
+                 codes:np.ndarray|None = None, scales:np.ndarray|None = None, rerank_factor:int = 4,
+                 coarse_dim:int|None = None) -> None:
+        self._ids = ids
+        self._documents = documents
+        self._metadatas = metadatas
+        self._vectors = vectors
+        self._codes = codes
+        self._scales = scales
+        self._rerank_factor = rerank_factor
+        self._coarse_dim = None
+        if coarse_dim is not None and len(self) and coarse_dim < self.dimension() :
+            self._coarse_dim = coarse_dim
+        self._coarse_norms = None # Normes des préfixes des vecteurs parcourus (calculées à la 1ère recherche)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def metadatas(self) -> list[dict]:
+        """Métadonnées des documents, dans l'ordre des lignes de l'index"""
+        return self._metadatas
+
+    def dimension(self) -> int|None:
+        """Dimension des vecteurs (None si l'index est vide)"""
+        return self._vectors.shape[1] if len(self) else None
+
+    def is_quantized(self) -> bool:
+        return self._codes is not None
+
+    def nbytes(self) -> int:
+        """Taille (en octets) des vecteurs parcourus à chaque recherche"""
+        if self.is_quantized() :
+            return self._codes.nbytes + self._scales.nbytes
+        return self._vectors.nbytes
+
+    # --------------------------------------------------------------------------
+    #                                                    Construction / stockage
+    # --------------------------------------------------------------------------
+
+    @classmethod
+    def from_collection(cls, vector_store:Chroma, *, quantize:bool = True, batch_size:int = 500, **kwargs) -> "LocalVectorIndex":
+        """Exporte une collection Chroma (par paquets) vers un index local"""
+        ids, documents, metadatas, blocks = [], [], [], []
+        for batch in iter_collection(vector_store._collection, batch_size=batch_size, include=["documents", "metadatas", "embeddings"]):
+            ids.extend(batch["ids"])
+            documents.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+            blocks.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        vectors = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        if not quantize :
+            return cls(ids=ids, documents=documents, metadatas=metadatas, vectors=vectors, **kwargs)
+        codes, scales = quantize_int8(vectors)
+        return cls(ids=ids, documents=documents, metadatas=metadatas, vectors=vectors.astype(np.float16),
+                   codes=codes, scales=scales, **kwargs)
+
+    def save(self, directory:str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "records.json"), 'w', encoding='utf-8') as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, f, ensure_ascii=False)
+        np.save(os.path.join(directory, "vectors.npy"), self._vectors)
+        if self.is_quantized() :
+            np.save(os.path.join(directory, "codes.npy"), self._codes)
+            np.save(os.path.join(directory, "scales.npy"), self._scales)
+
+    @classmethod
+    def load(cls, directory:str, **kwargs) -> "LocalVectorIndex":
+        """Charge un index local. Pour un index quantifié, les vecteurs float16 restent sur disque (mmap)."""
+        with open(os.path.join(directory, "records.json"), 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        codes, scales = None, None
+        if os.path.exists(os.path.join(directory, "codes.npy")) :
+            codes = np.load(os.path.join(directory, "codes.npy"))
+            scales = np.load(os.path.join(directory, "scales.npy"))
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r" if codes is not None else None)
+        return cls(ids=records["ids"], documents=records["documents"], metadatas=records["metadatas"],
+                   vectors=vectors, codes=codes, scales=scales, **kwargs)
+
+    # --------------------------------------------------------------------------
+    #                                                                  Recherche
+    # --------------------------------------------------------------------------
+
+    def search(self, query_vector:list[float]|np.ndarray, k:int, *, mask:np.ndarray|None = None) -> list[tuple[Document, float]]:
+        """
+        Renvoie les k documents les plus proches du vecteur de la requête.
+        mask : si précisé, on ne cherche que parmi les lignes à True (cf. metadata_index.py).
+        """
+        if len(self) == 0 :
+            return []
+        # Copie normalisée : le vecteur de l'appelant n'est pas modifié
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        if mask is not None :
+            # Recherche exacte, mais sur le sous-ensemble des lignes du masque seulement
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0 :
+                return []
+            scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            return [(self._document(rows[i]), float(scores[i])) for i in self._top(scores, k)]
+
+        if not self.is_quantized() and self._coarse_dim is None :
+            scores = self._vectors @ query
+            rows = self._top(scores, k)
+            return [(self._document(row), float(scores[row])) for row in rows]
+
+        # 1 - Parcours approché de toute la base (codes int8 et/ou préfixes des vecteurs)
+        approx = self._coarse_scores(query)
+        candidates = np.sort(self._top(approx, k * self._rerank_factor))
+
+        # 2 - Re-classement des candidats avec les vecteurs complets
+        exact = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+        order = np.argsort(-exact)[:k]
+        return [(self._document(candidates[i]), float(exact[i])) for i in order]
+
+    def _coarse_scores(self, query:np.ndarray) -> np.ndarray:
+        """Similarités approchées de la requête avec tous les vecteurs"""
+        width = self._coarse_dim or self.dimension()
+        matrix = self._codes if self.is_quantized() else self._vectors
+        prefix = query[:width]
+        scores = np.empty(len(self), dtype=np.float32)
+        norms = None
+        if self._coarse_dim is not None and self._coarse_norms is None :
+            norms = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_BLOCK_SIZE):
+            block = np.asarray(matrix[start:start + SCAN_BLOCK_SIZE, :width], dtype=np.float32)
+            if self.is_quantized() :
+                block *= self._scales[start:start + len(block), None]
+            scores[start:start + len(block)] = block @ prefix
+            if norms is not None :
+                norms[start:start + len(block)] = np.linalg.norm(block, axis=1)
+        if norms is not None :
+            self._coarse_norms = np.where(norms == 0, 1.0, norms)
+        if self._coarse_dim is None :
+            return scores
+        # Similarité cosinus sur les préfixes : il faut renormaliser les préfixes
+        return scores / self._coarse_norms / (np.linalg.norm(prefix) or 1.0)
+
+    @staticmethod
+    def _top(scores:np.ndarray, k:int) -> np.ndarray:
+        """Indices des k meilleurs scores, triés par score décroissant"""
+        k = min(k, len(scores))
+        rows = np.argpartition(-scores, k - 1)[:k]
+        return rows[np.argsort(-scores[rows])]
+
+    def _document(self, row:int) -> Document:
+        return Document(id=self._ids[row], page_content=self._documents[row], metadata=self._metadatas[row])
@@ -0,0 +1,116 @@
+# -*- coding: utf8 -*-
+#
+# Index en mémoire des métadonnées structurelles des articles (livre, titre,
+# chapitre, section, loi, ordonnance, ...) sous forme de bitmaps : pour chaque
+# valeur d'un champ, un tableau de booléens (une case par article). Une
+# "portée" de recherche (par ex. le Livre II seulement, ou les articles issus
+# d'une loi de 2021) est traduite en masque d'articles par des ET / OU entre
+# bitmaps, puis appliquée comme pré-filtre à la recherche vectorielle.
+
+import numpy as np
+
+from mytools import iter_collection
+
+# Champs utilisables dans une portée : nom dans la portée -> clé dans les métadonnées
+SCOPE_FIELDS = {
+    "livre": "livre_numero",
+    "titre": "titre_numero",
+    "chapitre": "chapitre_numero",
+    "section": "section_numero",
+    "chapitre_cle": "chapitre_cle",
+    "loi": "loi_numero",
+    "ordonnance": "ordonnance_numero",
+    "article": "article_numero",
+}
+
+# Champ sans bitmap (une valeur par article) : recherche directe de la ligne
+ROW_FIELDS = {"article_numero"}
+
+# Une valeur qui se termine par ce caractère est un préfixe ("2021-*", "221-*")
+PREFIX_WILDCARD = "*"
+
+# Une portée : champ -> valeur ou liste de valeurs (OU entre les valeurs d'un champ, ET entre les champs)
+Scope = dict[str, str|list[str]]
+
+
+def check_scope(scope:Scope|None) -> None:
+    """Lève une ValueError si la portée utilise un champ inconnu ou une valeur vide"""
+    for field, values in (scope or {}).items() :
+        if field not in SCOPE_FIELDS :
+            raise ValueError(f"Champ de portée inconnu : '{field}' (possibles : {', '.join(SCOPE_FIELDS)})")
+        values = values if isinstance(values, list) else [values]
+        if not values or not all(isinstance(value, str) and value.strip(PREFIX_WILDCARD) for value in values) :
+            raise ValueError(f"Valeur de portée invalide pour '{field}' : {values}")
+
+
+class MetadataIndex :
+    """Bitmaps des métadonnées d'une liste d'articles (l'ordre des lignes est celui de metadatas)"""
+
+    def __init__(self, metadatas:list[dict]) -> None:
+        self._metadatas = metadatas
+        self._bitmaps : dict[str, dict[str, np.ndarray]] = {}
+        self._rows : dict[str, int] = {}
+        for row, metadata in enumerate(metadatas) :
+            numero = metadata.get("article_numero")
+            if numero is not None :
+                self._rows.setdefault(str(numero), row)
+            for key in SCOPE_FIELDS.values() :
+                value = metadata.get(key)
+                if value is None or key in ROW_FIELDS :
+                    continue
+                bitmap = self._bitmaps.setdefault(key, {}).get(str(value))
+                if bitmap is None :
+                    bitmap = self._bitmaps[key][str(value)] = np.zeros(len(metadatas), dtype=bool)
+                bitmap[row] = True
+
+    @classmethod
+    def from_collection(cls, collection, *, batch_size:int = 500) -> "MetadataIndex":
+        """Index des métadonnées d'une collection Chroma (sans requête API)"""
+        metadatas = []
+        for batch in iter_collection(collection, batch_size=batch_size, include=["metadatas"]) :
+            metadatas += batch["metadatas"]
+        return cls(metadatas)
+
+    def __len__(self) -> int:
+        return len(self._metadatas)
+
+    def mask(self, scope:Scope|None) -> np.ndarray|None:
+        """Masque des articles dans la portée (None si la portée est vide : pas de filtre)"""
+        check_scope(scope)
+        if not scope :
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for field, values in scope.items() :
+            key = SCOPE_FIELDS[field]
+            field_mask = np.zeros(len(self), dtype=bool)
+            for value in (values if isinstance(values, list) else [values]) :
+                field_mask |= self._match(key, value)
+            mask &= field_mask
+        return mask
+
+    def values(self, mask:np.ndarray, key:str) -> list[str]:
+        """Valeurs distinctes (dans l'ordre des lignes) d'une métadonnée parmi les articles du masque"""
+        values = {}
+        for row in np.flatnonzero(mask) :
+            value = self._metadatas[row].get(key)
+            if value is not None :
+                values[str(value)] = None
+        return list(values)
+
+    def _match(self, key:str, value:str) -> np.ndarray:
+        """Bitmap des articles dont la métadonnée key vaut value (ou commence par value si elle finit par *)"""
+        bitmap = np.zeros(len(self), dtype=bool)
+        if key in ROW_FIELDS :
+            if value.endswith(PREFIX_WILDCARD) :
+                rows = [row for numero, row in self._rows.items() if numero.startswith(value[:-1])]
+            else :
+                rows = [self._rows[value]] if value in self._rows else []
+            bitmap[rows] = True
+            return bitmap
+        bitmaps = self._bitmaps.get(key, {})
+        if value.endswith(PREFIX_WILDCARD) :
+            for candidate, candidate_bitmap in bitmaps.items() :
+                if candidate.startswith(value[:-1]) :
+                    bitmap |= candidate_bitmap
+            return bitmap
+        return bitmaps.get(value, bitmap)
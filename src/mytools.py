@@ -1,7 +1,10 @@
 
 import os
 import getpass
+import hashlib
 import json
+import re
+import unicodedata
 from dotenv import load_dotenv
 from langsmith import Client
 from pathlib import Path
@@ -51,6 +54,46 @@ def load_QA(fichier_json:str) -> list[dict]:
 
     return qa_list
 
+def estimate_tokens(text:str) -> int:
+    """
+    Estimation rapide (sans requête API) du nombre de tokens d'un texte.
+    On compte ~4 caractères par token, ce qui est l'ordre de grandeur
+    annoncé pour les modèles Gemini sur du texte en français.
+    """
+    if not text :
+        return 0
+    return len(text) // 4 + 1
+
+def normalize_question(question:str) -> str:
+    """
+    Forme normalisée d'une question, pour reconnaître deux questions identiques
+    à la casse, aux accents, aux espaces et à la ponctuation finale près.
+    """
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+def fingerprint(*parts) -> str:
+    """Empreinte courte (hash) d'une liste de valeurs, pour versionner des prompts, des paramètres, ..."""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:12]
+
+def iter_collection(collection, *, batch_size:int=500, include:list[str]|None=None, where:dict|None=None, where_document:dict|None=None):
+    """
+    Parcourt une collection Chroma par paquets de batch_size éléments (pour ne
+    pas tout charger en mémoire d'un coup). Chaque paquet est le dictionnaire
+    renvoyé par collection.get (clés ids, documents, metadatas, ...).
+    """
+    if include is None :
+        include = ["documents", "metadatas"]
+    offset = 0
+    while True :
+        batch = collection.get(limit=batch_size, offset=offset, include=include, where=where, where_document=where_document)
+        if not batch["ids"] :
+            return
+        yield batch
+        offset += len(batch["ids"])
+
 def test_langsmithAPI():
     setup_env_variables(auto=True, verbose=True)
     try:
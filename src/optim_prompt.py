@@ -3,15 +3,10 @@
 
 from aiexpertlawyer import AIExpertLawyer
 from aijudge import AIJudge
-import time
-from tqdm import tqdm
 
 # Nombre de bouclage pour optimiser le prompt
 N = 3
 
-# Durée de la pause entre deux jugement
-pause_inter_seance = 61 # secondes
-
 # On va écrire des logs ici :
 log_juge = "logs/optim/juge.log"
 log_expert = "logs/optim/expert.log"
@@ -34,8 +29,12 @@ finale_question = "Est-ce qu'on utilise toujours la guillotine ?"
 # RQ : on aurait pu aussi chercher à optimiser la temperature etc etc mais
 # on aura pas le temps ici
 
-# RQ : il n'est pas impossible que le prompt proposé par le juge ne soit pas 
-# adéquate et alors on aura un erreur !
+# RQ : les quotas de l'API sont gérés par le client commun du fournisseur
+# (provider.py), plus besoin de faire des pauses entre deux jugements
+
+# RQ : il n'est pas impossible que le prompt proposé par le juge ne soit pas
+# adéquate : il est alors refusé (sans requête API, cf. prompt_registry.py) et
+# on garde le prompt précédent pour le jugement suivant
 
 ################################################################################
 
@@ -46,27 +45,30 @@ juge = AIJudge(temperature=temperature_juge, top_p=top_p_juge, logfile=log_juge,
 expert = AIExpertLawyer(temperature=temperature_experts, nb_chunk=nb_chunk_experts, top_p=top_p_experts, logfile=log_expert)
 print("Prompt de notre premier expert :\n"+("-"*10)+f"\n{expert.get_system_prompt()}\n"+("-"*10)+"\n")
 
+# Notes données par le juge, par version de prompt (cf. prompt_registry.py)
+notes = {}
+
 # Et on boucle (pas trop de fois pour pas trop utiliser notre quotat)
 for i in range(N):
 
     # Jugement : 
     note, proposition_prompt = juge.evaluate(expert)
+    notes[expert.get_prompt_template().version] = note
 
     # Affichage pour le suvit :
-    print(f"\nJugement numéro {i+1} : note = {note}/10")
+    print(f"\nJugement numéro {i+1} : note = {note}/10 (prompt {expert.get_prompt_template().version})")
+    if proposition_prompt is None :
+        print("Le prompt proposé n'est pas utilisable : on garde le prompt actuel.\n")
+        continue
     print("On va créer un nouvel expert avec le prompt système suivant :\n"+("-"*10)+f"\n{proposition_prompt}\n"+("-"*10)+"\n")
 
     # Création d'un nouvel expert :
     expert = AIExpertLawyer(temperature=temperature_experts, nb_chunk=nb_chunk_experts, top_p=top_p_experts, logfile=log_expert, system_prompt=proposition_prompt)
 
-    # Petite pause pour éviter certain problèmes de requêtes
-    print("Mais d'abord une petite pause !")
-    for i in tqdm(range(pause_inter_seance*10)):
-        time.sleep(0.1)
-
 
 # Enfin on pose la dernière question à notre expert "optimisé" :
 print("="*80+"\n")
+print("Notes par version de prompt : " + ", ".join(f"{version} : {note}/10" for version, note in notes.items()))
 print(f"""Question finale pour l'expert optimisé : "{finale_question}".""")
 response = expert.ask(finale_question)
 print(f"""Réponse de l'expert optimisé :\n"{response}"\n""")
@@ -0,0 +1,99 @@
+# Script pour précalculer (hors ligne, aux heures creuses) les réponses de
+# l'expert aux questions fréquentes : celles de QA.json et celles du fichier
+# QUESTIONS_FILE (une question par ligne, par ex. issues des logs du support).
+# Le serveur (interface.py) sert ensuite ces réponses instantanément, tant que
+# l'index et le prompt de l'expert n'ont pas changé (cf. answer_store.py).
+
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+from mytools import setup_env_variables, load_QA, normalize_question
+from aiexpertlawyer import AIExpertLawyer
+from answer_store import AnswerStore
+from context_builder import context_articles
+from provider import configure_provider, QuotaExceededError
+
+# Base des réponses précalculées (la même que celle du serveur, cf. ANSWER_STORE dans .env)
+ANSWER_STORE = os.environ.get("ANSWER_STORE", "data/answers.sqlite")
+
+# Questions à précalculer
+QA_FILE = "data/QA.json"
+QUESTIONS_FILE = "data/questions_frequentes.txt"
+
+# Heures creuses (début, fin) pendant lesquelles on lance les requêtes, None pour ne pas attendre
+OFF_PEAK_HOURS = None # par ex. (22, 7)
+
+# On a 100 requete par minutes max sur l'API Google : le client commun du
+# fournisseur (provider.py) étale les requêtes et réessaie en cas de quota
+RPM_LIMIT = 100
+configure_provider(requests_per_minute=RPM_LIMIT - 5)
+NB_WORKERS = 4
+
+
+def is_off_peak(hours:tuple[int, int]|None) -> bool:
+    if hours is None :
+        return True
+    start, end = hours
+    hour = datetime.datetime.now().hour
+    return start <= hour < end if start < end else (hour >= start or hour < end)
+
+
+def load_questions() -> list[str]:
+    """Questions de QA.json et de QUESTIONS_FILE, sans doublon (à la normalisation près)"""
+    questions = [qa["question"] for qa in load_QA(QA_FILE)]
+    if os.path.exists(QUESTIONS_FILE) :
+        with open(QUESTIONS_FILE, 'r', encoding='utf-8') as f:
+            questions += [line.strip() for line in f if line.strip()]
+    unique = {}
+    for question in questions :
+        unique.setdefault(normalize_question(question), question)
+    return list(unique.values())
+
+
+def answer(expert:AIExpertLawyer, question:str) -> tuple[str, list[str]]:
+    """Réponse de l'expert et articles du contexte utilisé"""
+    rag_data = expert.build_context(question)
+    return expert.generate(expert.build_prompt(question, rag_data)), context_articles(rag_data)
+
+
+if __name__ == '__main__':
+
+    print("1 - 🖊️ Gestion de l'environnement.", flush=True)
+    setup_env_variables(auto=True, verbose=True)
+
+    # Même paramétrage que l'expert du serveur (sinon ses réponses ne seront pas servies)
+    expert = AIExpertLawyer(rerank=os.environ.get("RERANK") or None, logfile="logs/precompute/expert.log")
+    store = AnswerStore(ANSWER_STORE)
+    versions = expert.answer_versions()
+    print(f"2 - 🗄️  {len(store)} réponses en base, {store.purge(**versions)} périmées supprimées (index {versions['index_version']}, prompt {versions['prompt_version']})")
+
+    questions = [q for q in load_questions() if store.get(q, **versions) is None]
+    print(f"3 - ❓ {len(questions)} questions à précalculer")
+
+    while not is_off_peak(OFF_PEAK_HOURS) :
+        print(f"   --> En attente des heures creuses {OFF_PEAK_HOURS} ...", flush=True)
+        time.sleep(600)
+
+    print("4 - 🤖 Calcul des réponses (une requête API par question) :")
+    nb_errors = 0
+    with ThreadPoolExecutor(max_workers=NB_WORKERS) as executor :
+        futures = {executor.submit(answer, expert, question): question for question in questions}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            question = futures[future]
+            try :
+                reponse, articles = future.result()
+            except QuotaExceededError :
+                # Plus de quota : on arrête, les réponses déjà calculées sont gardées
+                print("⚠️  Quota de l'API dépassé, on s'arrête là (relancer plus tard).")
+                executor.shutdown(cancel_futures=True)
+                break
+            except Exception as e :
+                nb_errors += 1
+                print(f"⚠️  Erreur pour la question \"{question}\" : {e}")
+                continue
+            store.put(question, reponse, articles=articles, **versions)
+
+    print(f"✅ {len(store)} réponses précalculées en base ({nb_errors} erreurs)")
@@ -0,0 +1,75 @@
+# -*- coding: utf8 -*-
+#
+# Cache à durée de vie courte des recherches faites à l'avance ("prefetch") :
+# pendant que l'utilisateur tape sa question, l'interface web demande la
+# recherche (embedding + base sémantique) pour le texte en cours. Quand la
+# question est envoyée, il ne reste plus qu'à appeler le LLM. Si la question
+# arrive pendant que sa recherche anticipée tourne encore, on attend son
+# résultat au lieu de la refaire.
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class PrefetchCache :
+    """Cache (thread-safe) des résultats calculés à l'avance, gardés ttl secondes (au plus max_entries)"""
+
+    def __init__(self, *, ttl:float = 60.0, max_entries:int = 256) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries : OrderedDict[Hashable, tuple[float, Future]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"prefetched": 0, "hits": 0, "misses": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def prefetch(self, key:Hashable, compute:Callable[[], Any]) -> bool:
+        """Calcule (dans le thread appelant) et garde le résultat de compute, sauf s'il est déjà là ou en cours (renvoie False)"""
+        if self._ttl <= 0 :
+            return False
+        future = Future()
+        with self._lock :
+            self._expire()
+            if key in self._entries :
+                return False
+            self._entries[key] = (time.monotonic() + self._ttl, future)
+            while len(self._entries) > self._max_entries :
+                self._entries.popitem(last=False)
+            self.stats["prefetched"] += 1
+        try :
+            future.set_result(compute())
+        except Exception as e :
+            # Une recherche anticipée ratée ne doit rien empêcher : la question refera la recherche
+            with self._lock :
+                self.stats["errors"] += 1
+                if self._entries.get(key, (None, None))[1] is future :
+                    del self._entries[key]
+            future.set_exception(e)
+            return False
+        return True
+
+    def get(self, key:Hashable) -> Any|None:
+        """Résultat calculé à l'avance pour key (en attendant la fin du calcul s'il est en cours), None sinon"""
+        with self._lock :
+            self._expire()
+            entry = self._entries.get(key)
+        if entry is None :
+            self.stats["misses"] += 1
+            return None
+        try :
+            value = entry[1].result()
+        except Exception :
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return value
+
+    def _expire(self) -> None:
+        # Même durée de vie pour tous : les entrées expirent dans l'ordre où elles ont été ajoutées
+        now = time.monotonic()
+        while self._entries and next(iter(self._entries.values()))[0] <= now :
+            self._entries.popitem(last=False)
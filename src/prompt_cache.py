@@ -0,0 +1,234 @@
+# -*- coding: utf8 -*-
+#
+# Mise en cache du préfixe statique des prompts : un prompt est construit à
+# partir d'un modèle (template) dont le début, avant la première variable, est
+# identique à chaque appel (instructions du prompt système). Ce préfixe peut
+# être gardé en cache côté fournisseur pour ne pas être re-facturé ni re-traité
+# à chaque appel :
+#   - LocalCachedPrefix : envoie le prompt complet (aucune requête en plus) et
+#     se contente de compter les tokens qui seraient servis par le cache,
+#   - GeminiCachedPrefix : crée un "cached content" Gemini par modèle et
+#     n'envoie plus que la suite du prompt (si le préfixe est assez long).
+# Attention : Gemini ne met en cache que les préfixes d'au moins
+# GEMINI_MIN_CACHED_TOKENS tokens. Le préfixe du prompt par défaut de l'expert
+# (~60 tokens) est bien en dessous : seul un prompt système qui met au moins
+# autant d'instructions fixes avant {rag_data} profite du cache Gemini. Les
+# économies comptées par LocalCachedPrefix ne sont qu'une estimation, les
+# statistiques distinguent donc les tokens réellement servis par le fournisseur.
+
+import string
+import threading
+import time
+from typing import Iterator
+
+from mytools import estimate_tokens
+from provider import is_quota_error
+
+# Prix d'un token d'entrée servi par le cache, relativement à un token normal
+CACHED_TOKEN_PRICE_RATIO = 0.25
+
+# Gemini refuse de mettre en cache un contenu plus court que ça (en tokens)
+GEMINI_MIN_CACHED_TOKENS = 1024
+
+# Durée de vie (s) d'un cache Gemini, et marge avant expiration pour le recréer
+GEMINI_CACHE_TTL = 3600
+GEMINI_CACHE_MARGIN = 60
+
+
+def split_template(template:str) -> tuple[str, str]:
+    """
+    Sépare un modèle de prompt (au format str.format) en son préfixe statique
+    (le texte avant la première variable, accolades doublées déjà résolues)
+    et le reste du modèle (toujours au format str.format).
+    """
+    prefix, length = "", 0
+    for literal, field_name, _, _ in string.Formatter().parse(template) :
+        prefix += literal
+        length += len(literal) + literal.count("{") + literal.count("}")
+        if field_name is not None :
+            break
+    return prefix, template[length:]
+
+
+class CachedPrefix :
+    """
+    Préfixe statique d'un modèle de prompt. Les prompts qui commencent par ce
+    préfixe sont envoyés via invoke / stream, qui comptent les tokens servis
+    par le cache (cf. report). Cette classe de base n'utilise aucun cache.
+    """
+
+    # Vrai si les tokens servis par le cache sont seulement estimés (rien n'est gardé chez le fournisseur)
+    simulated = False
+
+    def __init__(self, prefix:str) -> None:
+        self.prefix = prefix
+        self.prefix_tokens = estimate_tokens(prefix)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "provider_cache_hits": 0, "provider_cached_tokens": 0}
+
+    @classmethod
+    def from_template(cls, template:str, **kwargs) -> "CachedPrefix":
+        return cls(split_template(template)[0], **kwargs)
+
+    def invoke(self, llm, prompt:str) -> str:
+        """Appelle llm sur le prompt (complet)"""
+        self._account(llm, prompt)
+        return llm.invoke(prompt)
+
+    def stream(self, llm, prompt:str) -> Iterator[str]:
+        """Comme invoke, morceau par morceau"""
+        self._account(llm, prompt)
+        yield from llm.stream(prompt)
+
+    def usage(self, llm, prompt:str) -> dict:
+        """Tokens d'entrée d'un appel (estimés), dont ceux servis par le cache"""
+        cached = self.prefix_tokens if prompt.startswith(self.prefix) and self._is_cached(llm) else 0
+        return {"input_tokens": estimate_tokens(prompt), "cached_tokens": cached}
+
+    def report(self) -> dict:
+        """
+        Tokens d'entrée envoyés depuis la création, dont ceux comptés comme servis
+        par le cache (cached_tokens, estimation si simulated) et ceux réellement
+        servis par le cache du fournisseur (provider_cached_tokens, en
+        provider_cache_hits appels), et l'équivalent facturé de chacun.
+        """
+        with self._lock :
+            stats = dict(self._stats)
+        stats["simulated"] = self.simulated
+        stats["prefix_tokens"] = self.prefix_tokens
+        # Un préfixe plus court n'est jamais mis en cache par Gemini
+        stats["prefix_cacheable"] = self.prefix_tokens >= GEMINI_MIN_CACHED_TOKENS
+        stats["estimated_billed_input_tokens"] = round(stats["input_tokens"] - stats["cached_tokens"] * (1 - CACHED_TOKEN_PRICE_RATIO))
+        stats["billed_input_tokens"] = round(stats["input_tokens"] - stats["provider_cached_tokens"] * (1 - CACHED_TOKEN_PRICE_RATIO))
+        return stats
+
+    def _is_cached(self, llm) -> bool:
+        return False
+
+    def _account(self, llm, prompt:str, *, provider_cached:bool = False) -> None:
+        """Compte un appel (provider_cached : le préfixe est réellement servi par le cache du fournisseur)"""
+        usage = self.usage(llm, prompt)
+        with self._lock :
+            self._stats["calls"] += 1
+            self._stats["input_tokens"] += usage["input_tokens"]
+            self._stats["cached_tokens"] += usage["cached_tokens"]
+            if provider_cached :
+                self._stats["provider_cache_hits"] += 1
+                self._stats["provider_cached_tokens"] += usage["cached_tokens"]
+
+
+class LocalCachedPrefix(CachedPrefix) :
+    """
+    Simulation locale d'un cache de préfixe (tests, estimations) : le prompt
+    complet est envoyé, mais à partir du 2e appel d'un même modèle le préfixe
+    est compté comme servi par le cache.
+    """
+
+    simulated = True
+
+    def __init__(self, prefix:str) -> None:
+        super().__init__(prefix)
+        self._warm_models : set[str] = set()
+
+    def _is_cached(self, llm) -> bool:
+        return getattr(llm, "model", None) in self._warm_models
+
+    def _account(self, llm, prompt:str, *, provider_cached:bool = False) -> None:
+        super()._account(llm, prompt)
+        if prompt.startswith(self.prefix) :
+            self._warm_models.add(getattr(llm, "model", None))
+
+
+class GeminiCachedPrefix(CachedPrefix) :
+    """
+    Préfixe gardé dans un "cached content" Gemini (un par modèle, recréé avant
+    expiration) : seule la suite du prompt est envoyée. Si le préfixe est trop
+    court pour Gemini ou si le cache ne peut pas être créé (package google-genai
+    absent, erreur), on envoie le prompt complet.
+    """
+
+    def __init__(self, prefix:str, *, ttl:int = GEMINI_CACHE_TTL) -> None:
+        super().__init__(prefix)
+        self._ttl = ttl
+        self._caches : dict[str, tuple[str, float]|None] = {} # modèle -> (nom du cache, expiration), None si impossible
+        self._cache_lock = threading.Lock()
+        if self.prefix_tokens < GEMINI_MIN_CACHED_TOKENS :
+            print(f"⚠️  Préfixe du prompt de {self.prefix_tokens} tokens (< {GEMINI_MIN_CACHED_TOKENS}) : il ne sera pas mis en cache par Gemini.")
+
+    def invoke(self, llm, prompt:str) -> str:
+        name = self._cache_name(llm) if prompt.startswith(self.prefix) else None
+        if name is not None :
+            try :
+                answer = llm.invoke(prompt[len(self.prefix):], cached_content=name)
+            except Exception as e :
+                if is_quota_error(e) :
+                    raise
+                self._forget(llm) # Cache expiré ou supprimé : on le recréera au prochain appel
+            else :
+                # Compté une seule fois, une fois qu'on sait que le cache a servi
+                self._account(llm, prompt, provider_cached=True)
+                return answer
+        return super().invoke(llm, prompt)
+
+    def stream(self, llm, prompt:str) -> Iterator[str]:
+        name = self._cache_name(llm) if prompt.startswith(self.prefix) else None
+        if name is None :
+            yield from super().stream(llm, prompt)
+            return
+        # Comme invoke : le cache a servi si le premier morceau arrive
+        chunks = iter(llm.stream(prompt[len(self.prefix):], cached_content=name))
+        try :
+            first = next(chunks, None)
+        except Exception as e :
+            if is_quota_error(e) :
+                raise
+            self._forget(llm)
+            yield from super().stream(llm, prompt)
+            return
+        self._account(llm, prompt, provider_cached=True)
+        if first is not None :
+            yield first
+        yield from chunks
+
+    def _is_cached(self, llm) -> bool:
+        entry = self._caches.get(llm.model)
+        return entry is not None and entry[1] > time.time()
+
+    def _forget(self, llm) -> None:
+        with self._cache_lock :
+            self._caches.pop(llm.model, None)
+
+    def _cache_name(self, llm) -> str|None:
+        """Nom du cache Gemini du préfixe pour le modèle de llm (créé si besoin), None si pas de cache"""
+        if self.prefix_tokens < GEMINI_MIN_CACHED_TOKENS :
+            return None
+        with self._cache_lock :
+            if llm.model in self._caches :
+                entry = self._caches[llm.model]
+                if entry is None or entry[1] > time.time() + GEMINI_CACHE_MARGIN :
+                    return None if entry is None else entry[0]
+            try :
+                from google import genai
+                from google.genai import types
+                # Appel direct : on est déjà dans un appel passé par le client du fournisseur
+                cache = genai.Client().caches.create(model=llm.model,
+                    config=types.CreateCachedContentConfig(system_instruction=self.prefix, ttl=f"{self._ttl}s"))
+            except Exception as e :
+                if is_quota_error(e) :
+                    raise
+                print(f"⚠️  Impossible de mettre en cache le préfixe du prompt pour {llm.model} : {e}")
+                self._caches[llm.model] = None
+                return None
+            self._caches[llm.model] = (cache.name, time.time() + self._ttl)
+            return cache.name
+
+
+# Implémentations disponibles (paramètre prompt_cache des agents)
+PROMPT_CACHES = {"none": CachedPrefix, "local": LocalCachedPrefix, "gemini": GeminiCachedPrefix}
+
+
+def make_prompt_cache(template:str, kind:str = "local") -> CachedPrefix:
+    """Cache du préfixe statique d'un modèle de prompt ("none", "local" ou "gemini")"""
+    if kind not in PROMPT_CACHES :
+        raise ValueError(f"Cache de prompt inconnu : '{kind}' (possibles : {', '.join(PROMPT_CACHES)})")
+    return PROMPT_CACHES[kind].from_template(template)
@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+#
+# Registre des modèles de prompt (au format str.format) : chaque modèle est
+# analysé et validé une seule fois (variables attendues présentes, aucune
+# variable inconnue, accolades bien fermées), puis gardé avec sa version
+# (empreinte de son contenu) et sa taille en tokens. Un prompt invalide (par
+# ex. proposé par le juge) est ainsi refusé avant toute requête API, et la
+# version sert de clé aux caches et aux métriques (réponses précalculées, ...).
+
+import string
+import threading
+from collections import OrderedDict
+
+from mytools import estimate_tokens, fingerprint
+
+
+class InvalidPromptError(ValueError) :
+    """Le modèle de prompt ne pourra pas être utilisé (variable manquante ou inconnue, accolade mal fermée)"""
+
+
+class PromptTemplate :
+    """Modèle de prompt validé, identifié par l'empreinte de son contenu"""
+
+    def __init__(self, template:str, fields:tuple[str, ...]) -> None:
+        self.template = template
+        self.fields = fields
+        self.version = fingerprint(template)
+        # Tokens du texte fixe (sans les variables)
+        self.tokens = estimate_tokens("".join(literal for literal, *_ in string.Formatter().parse(template)))
+
+    def format(self, **values:str) -> str:
+        return self.template.format(**values)
+
+    def report(self) -> dict:
+        return {"version": self.version, "tokens": self.tokens, "fields": list(self.fields)}
+
+
+def parse_template(template:str, *, required:tuple[str, ...] = (), allowed:tuple[str, ...]|None = None) -> tuple[str, ...]:
+    """
+    Variables du modèle, dans l'ordre de leur première apparition.
+    Lève une InvalidPromptError si une variable de required manque, si une
+    variable n'est pas dans allowed (par défaut : required) ou si le modèle est
+    mal formé (accolade seule, variable positionnelle, format ou conversion).
+    """
+    if not isinstance(template, str) or not template.strip() :
+        raise InvalidPromptError("Le prompt est vide")
+    allowed = required if allowed is None else allowed
+    fields = []
+    try :
+        for _, field_name, format_spec, conversion in string.Formatter().parse(template) :
+            if field_name is None :
+                continue
+            if field_name not in allowed :
+                raise InvalidPromptError(f"Variable inconnue dans le prompt : '{{{field_name}}}' (possibles : {', '.join(allowed)} ; " +
+                                         "les accolades du texte doivent être doublées)")
+            if format_spec or conversion :
+                raise InvalidPromptError(f"Format non supporté pour la variable '{field_name}' dans le prompt")
+            if field_name not in fields :
+                fields.append(field_name)
+    except ValueError as e :
+        if isinstance(e, InvalidPromptError) :
+            raise
+        raise InvalidPromptError(f"Prompt mal formé : {e} (les accolades du texte doivent être doublées)")
+    missing = [field for field in required if field not in fields]
+    if missing :
+        raise InvalidPromptError(f"Variable(s) manquante(s) dans le prompt : {', '.join('{' + field + '}' for field in missing)}")
+    return tuple(fields)
+
+
+class PromptRegistry :
+    """Modèles de prompt déjà validés (au plus max_templates, les moins récemment utilisés sont oubliés)"""
+
+    def __init__(self, *, max_templates:int = 1000) -> None:
+        self._max_templates = max_templates
+        self._templates : OrderedDict[tuple, PromptTemplate] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"compiled": 0, "hits": 0, "rejected": 0}
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def compile(self, template:str, *, required:tuple[str, ...] = (), allowed:tuple[str, ...]|None = None) -> PromptTemplate:
+        """Modèle validé (cf. parse_template), analysé seulement la 1ère fois qu'on le rencontre"""
+        key = (template, required, allowed)
+        with self._lock :
+            compiled = self._templates.get(key)
+            if compiled is not None :
+                self._templates.move_to_end(key)
+                self.stats["hits"] += 1
+                return compiled
+        try :
+            compiled = PromptTemplate(template, parse_template(template, required=required, allowed=allowed))
+        except InvalidPromptError :
+            self.stats["rejected"] += 1
+            raise
+        with self._lock :
+            self._templates[key] = compiled
+            self.stats["compiled"] += 1
+            while len(self._templates) > self._max_templates :
+                self._templates.popitem(last=False)
+        return compiled
+
+    def get(self, version:str) -> PromptTemplate|None:
+        """Modèle déjà validé de cette version, s'il est encore dans le registre"""
+        with self._lock :
+            for compiled in self._templates.values() :
+                if compiled.version == version :
+                    return compiled
+        return None
+
+
+# Registre unique pour tout le processus (experts, juge, ...)
+PROMPTS = PromptRegistry()
+
+
+def compile_prompt(template:str, *, required:tuple[str, ...] = (), allowed:tuple[str, ...]|None = None) -> PromptTemplate:
+    return PROMPTS.compile(template, required=required, allowed=allowed)
@@ -0,0 +1,295 @@
+# -*- coding: utf8 -*-
+#
+# Couche commune d'accès au fournisseur de LLM / d'embeddings (Google Gemini)
+# pour tout le processus :
+#   - un seau à jetons limite le nombre de requêtes par minute,
+#   - la concurrence s'adapte (AIMD : +1 progressivement tant que tout va bien,
+#     divisée par 2 dès que le fournisseur signale un dépassement de quota),
+#   - les erreurs de quota (429) sont réessayées avec un délai exponentiel
+#     aléatoire ("jitter"),
+#   - les clients LLM / embeddings sont partagés (connexions réutilisées).
+# On y trouve aussi la file d'admission du serveur, qui refuse les requêtes
+# (503 + Retry-After) plutôt que de les empiler quand il est saturé.
+
+import asyncio
+import contextlib
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable
+from langchain_google_genai import GoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+
+class QuotaExceededError(Exception) :
+    """Le fournisseur refuse toujours la requête (quota) après tous les essais"""
+
+    def __init__(self, message:str, retry_after:float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ServerOverloadedError(Exception) :
+    """La file d'admission du serveur est pleine"""
+
+    def __init__(self, retry_after:float) -> None:
+        super().__init__("Serveur saturé, réessayez plus tard")
+        self.retry_after = retry_after
+
+
+def is_quota_error(error:BaseException) -> bool:
+    """Vrai si l'erreur correspond à un dépassement de quota / de débit (HTTP 429)"""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests") :
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower()
+
+
+class TokenBucket :
+    """Seau à jetons (thread-safe) : au plus rate requêtes par seconde en moyenne, par rafales de capacity"""
+
+    def __init__(self, *, rate:float, capacity:float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Attend qu'un jeton soit disponible et le consomme"""
+        while True :
+            with self._lock :
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1 :
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class AIMDLimiter :
+    """Limite de concurrence adaptative (augmentation additive, diminution multiplicative)"""
+
+    def __init__(self, *, initial:int, maximum:int, minimum:int = 1) -> None:
+        self.limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+        self.in_flight = 0
+        self._changed = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._changed :
+            self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def release(self, *, overloaded:bool) -> None:
+        with self._changed :
+            self.in_flight -= 1
+            if overloaded :
+                self.limit = max(self._minimum, self.limit / 2)
+            else :
+                # +1 après environ "limit" succès
+                self.limit = min(self._maximum, self.limit + 1 / self.limit)
+            self._changed.notify_all()
+
+
+class ProviderClient :
+    """Exécute les appels au fournisseur en respectant débit, concurrence et quotas"""
+
+    def __init__(self, *, requests_per_minute:float = 95, max_concurrency:int = 8, max_retries:int = 5,
+                 base_delay:float = 1.0, max_delay:float = 60.0) -> None:
+        self._bucket = TokenBucket(rate=requests_per_minute / 60, capacity=max(1, max_concurrency))
+        self._limiter = AIMDLimiter(initial=max(1, max_concurrency // 2), maximum=max_concurrency)
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self.stats = {"calls": 0, "quota_errors": 0, "failures": 0}
+
+    def _backoff(self, attempt:int) -> float:
+        """Délai avant le prochain essai : exponentiel, tiré au hasard ("full jitter")"""
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+    def call(self, fn:Callable[..., Any], *args, **kwargs) -> Any:
+        """Appelle fn(*args, **kwargs), en réessayant sur les erreurs de quota"""
+        for attempt in range(self._max_retries + 1) :
+            self._bucket.acquire()
+            self._limiter.acquire()
+            overloaded = False
+            try :
+                self.stats["calls"] += 1
+                return fn(*args, **kwargs)
+            except Exception as e :
+                if not is_quota_error(e) :
+                    raise
+                overloaded = True
+                self.stats["quota_errors"] += 1
+            finally :
+                self._limiter.release(overloaded=overloaded)
+            time.sleep(self._backoff(attempt))
+        self.stats["failures"] += 1
+        raise QuotaExceededError("Quota du fournisseur dépassé", retry_after=self._max_delay)
+
+    def stream(self, fn:Callable[..., Iterator[Any]], *args, **kwargs) -> Iterator[Any]:
+        """
+        Comme call, pour un appel qui renvoie un flux. On ne réessaie que si
+        l'erreur de quota arrive avant le premier morceau (ensuite le début de
+        la réponse a déjà été envoyé).
+        """
+        for attempt in range(self._max_retries + 1) :
+            self._bucket.acquire()
+            self._limiter.acquire()
+            overloaded = False
+            started = False
+            try :
+                self.stats["calls"] += 1
+                for chunk in fn(*args, **kwargs) :
+                    started = True
+                    yield chunk
+                return
+            except Exception as e :
+                if started or not is_quota_error(e) :
+                    raise
+                overloaded = True
+                self.stats["quota_errors"] += 1
+            finally :
+                self._limiter.release(overloaded=overloaded)
+            time.sleep(self._backoff(attempt))
+        self.stats["failures"] += 1
+        raise QuotaExceededError("Quota du fournisseur dépassé", retry_after=self._max_delay)
+
+
+# Client unique pour tout le processus (cf. get_provider)
+_provider : ProviderClient|None = None
+_provider_lock = threading.Lock()
+
+
+def configure_provider(**kwargs) -> ProviderClient:
+    """(Re)crée le client du processus avec d'autres paramètres (cf. ProviderClient)"""
+    global _provider
+    with _provider_lock :
+        _provider = ProviderClient(**kwargs)
+    return _provider
+
+
+def get_provider() -> ProviderClient:
+    """Client du processus, paramétrable par les variables d'environnement PROVIDER_RPM et PROVIDER_MAX_CONCURRENCY"""
+    global _provider
+    with _provider_lock :
+        if _provider is None :
+            _provider = ProviderClient(
+                requests_per_minute=float(os.environ.get("PROVIDER_RPM", 95)),
+                max_concurrency=int(os.environ.get("PROVIDER_MAX_CONCURRENCY", 8)),
+            )
+        return _provider
+
+
+# Clients Gemini partagés par tout le processus : chaque client garde sa connexion
+# (canal gRPC / HTTP keep-alive) ouverte entre les requêtes. En recréer un par
+# expert (à chaque /configure ou /ask avec des paramètres spécifiques) coûtait une
+# nouvelle poignée de main TLS au premier appel. Un seul client par modèle : les
+# paramètres de génération (choisis librement par les clients de /ask) sont passés
+# à chaque appel, sinon chaque nouvelle valeur garderait un client de plus.
+_clients : dict[tuple, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(key:tuple, factory:Callable[[], Any]) -> Any:
+    with _clients_lock :
+        client = _clients.get(key)
+        if client is None :
+            client = _clients[key] = factory()
+        return client
+
+
+def get_llm(model:str, *, temperature:float = 0.0, top_p:float|None = None) -> Runnable:
+    """
+    LLM avec ces paramètres de génération, sur le client partagé du modèle (les
+    nouveaux essais sont gérés par ProviderClient). S'utilise comme le client
+    (invoke, stream, attribut model).
+    """
+    client = _shared_client(("llm", model), lambda: GoogleGenerativeAI(model=model, max_retries=1))
+    generation_config = {"temperature": temperature} if top_p is None else {"temperature": temperature, "top_p": top_p}
+    return client.bind(generation_config=generation_config)
+
+
+def get_embeddings_client(model:str) -> GoogleGenerativeAIEmbeddings:
+    """Client d'embeddings partagé pour ce modèle"""
+    def factory() -> GoogleGenerativeAIEmbeddings:
+        # Le client ouvre aussi un canal gRPC asynchrone, qui a besoin d'une boucle asyncio dans le
+        # thread : hors du thread principal (expert construit en arrière-plan), on lui en donne une
+        if threading.current_thread() is not threading.main_thread() :
+            try :
+                asyncio.get_event_loop()
+            except RuntimeError :
+                asyncio.set_event_loop(asyncio.new_event_loop())
+        return GoogleGenerativeAIEmbeddings(model=model)
+    return _shared_client(("embeddings", model), factory)
+
+
+def nb_shared_clients() -> int:
+    return len(_clients)
+
+
+class RateLimitedEmbeddings(Embeddings) :
+    """Embeddings dont les appels passent par le client du fournisseur"""
+
+    def __init__(self, embeddings:Embeddings) -> None:
+        self._embeddings = embeddings
+
+    def embed_documents(self, texts:list[str]) -> list[list[float]]:
+        return get_provider().call(self._embeddings.embed_documents, texts)
+
+    def embed_query(self, text:str) -> list[float]:
+        return get_provider().call(self._embeddings.embed_query, text)
+
+
+class AdmissionQueue :
+    """
+    File d'admission du serveur (asyncio) : au plus max_in_flight requêtes
+    traitées en même temps et max_waiting en attente. Au-delà, la requête est
+    refusée tout de suite (ServerOverloadedError) avec un délai conseillé.
+    """
+
+    def __init__(self, *, max_in_flight:int = 8, max_waiting:int = 32) -> None:
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._max_in_flight = max_in_flight
+        self._max_waiting = max_waiting
+        self._waiting = 0
+        self._mean_duration = 5.0 # Durée moyenne d'une requête (s), lissée
+        self.nb_rejected = 0
+
+    def retry_after(self) -> int:
+        """Délai conseillé (s) : le temps estimé pour vider la file"""
+        return max(1, math.ceil(self._mean_duration * (self._waiting + 1) / self._max_in_flight))
+
+    def is_full(self) -> bool:
+        """Vrai si une nouvelle requête serait refusée tout de suite (file d'attente pleine)"""
+        return self._waiting >= self._max_waiting
+
+    def is_busy(self) -> bool:
+        """Vrai si toutes les places sont prises (une nouvelle requête devrait attendre)"""
+        return self._semaphore.locked()
+
+    @contextlib.asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Contexte d'une requête admise (lève ServerOverloadedError si la file est pleine)"""
+        if self.is_full() :
+            self.nb_rejected += 1
+            raise ServerOverloadedError(self.retry_after())
+        self._waiting += 1
+        try :
+            await self._semaphore.acquire()
+        finally :
+            self._waiting -= 1
+        start = time.monotonic()
+        try :
+            yield
+        finally :
+            self._mean_duration = 0.9 * self._mean_duration + 0.1 * (time.monotonic() - start)
+            self._semaphore.release()
@@ -0,0 +1,31 @@
+# -*- coding: utf8 -*-
+#
+# Publication de la base de donnée (RAG) comme nouvelle version immuable (cf.
+# snapshots.py), à lancer une fois l'ingestion terminée (fill_rag.py,
+# build_hierarchy.py, build_local_index.py, build_references.py). Le serveur
+# bascule dessus sans interruption (POST /reload, ou automatiquement si
+# SNAPSHOT_POLL_SECONDS est défini). Aucune requête API.
+#
+# Les anciennes versions sont ensuite supprimées, sauf la nouvelle et celle
+# qui était en service jusque-là (le serveur s'en sert tant qu'il n'a pas
+# basculé). Attention : une version remise en service avec POST /reload
+# {"version": "..."} ne change pas CURRENT, ce script ne peut pas la connaître :
+# garder assez de versions (NB_SNAPSHOTS_KEPT) ou ajouter cette version à
+# PROTECTED_SNAPSHOTS tant que le serveur s'en sert.
+from snapshots import SNAPSHOTS_DIR, current_snapshot, publish_snapshot, prune_snapshots, read_manifest
+
+persist_directory = "./chroma_langchain_db"
+
+# Nombre de versions gardées (les plus récentes, plus celle en service)
+NB_SNAPSHOTS_KEPT = 3
+
+# Versions à ne jamais supprimer (par ex. celle remise en service par POST /reload {"version": "..."})
+PROTECTED_SNAPSHOTS = ()
+
+previous = current_snapshot()
+version = publish_snapshot(persist_directory)
+manifest = read_manifest(version)
+print(f"Version {version} publiée dans {SNAPSHOTS_DIR} : {manifest['collections']}")
+removed = prune_snapshots(keep=NB_SNAPSHOTS_KEPT, protected=tuple(filter(None, (previous, *PROTECTED_SNAPSHOTS))))
+if removed :
+    print(f"Anciennes versions supprimées : {', '.join(removed)}")
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+#
+# Graphe des renvois entre articles ("dans les conditions prévues à l'article
+# 131-7 ...") : construit à l'ingestion, sauvegardé à côté de la collection
+# Chroma, et utilisé pour compléter les résultats d'une recherche avec les
+# articles qu'ils citent (un seul saut, dans la limite d'un budget de tokens).
+
+import json
+import os
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from mytools import iter_collection, estimate_tokens
+from chunker import extract_references
+
+# Les articles ajoutés par renvoi passent après tous les résultats directs : ils
+# ont un score plus petit que le plus petit score direct, d'un pas de plus pour
+# chacun (dans l'ordre de pertinence de l'article qui les cite). Un score
+# multiplié par un facteur < 1 ne convient pas : il remonte si le score est négatif.
+REFERENCE_SCORE_STEP = 1e-6
+
+
+def references_path(persist_directory:str, collection_name:str) -> str:
+    """Chemin du fichier du graphe des renvois d'une collection"""
+    return os.path.join(persist_directory, f"{collection_name}_references.json")
+
+
+class ReferenceGraph :
+    """
+    Liste d'adjacence article -> articles cités, plus la correspondance
+    article -> id Chroma pour récupérer les articles cités sans recherche
+    de similarité.
+    """
+
+    def __init__(self, edges:dict[str, list[str]]|None = None, ids:dict[str, str]|None = None) -> None:
+        self._edges = edges or {}
+        self._ids = ids or {}
+
+    def __len__(self) -> int:
+        return sum(len(cited) for cited in self._edges.values())
+
+    def neighbours(self, article:str) -> list[str]:
+        """Articles cités par un article (et présents dans la collection)"""
+        return [cited for cited in self._edges.get(article, []) if cited in self._ids]
+
+    @classmethod
+    def from_collection(cls, vector_store:Chroma, *, batch_size:int = 500) -> "ReferenceGraph":
+        """
+        Construit le graphe à partir d'une collection. On utilise la métadonnée
+        'articles_cites' posée par le chunker, ou à défaut (collections plus
+        anciennes) on extrait les renvois du texte de l'article.
+        """
+        edges, ids = {}, {}
+        for batch in iter_collection(vector_store._collection, batch_size=batch_size):
+            for id_, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                article = metadata.get("article_numero")
+                if article is None :
+                    continue
+                ids[article] = id_
+                if "articles_cites" in metadata :
+                    cited = [numero for numero in metadata["articles_cites"].split(",") if numero]
+                else :
+                    cited = extract_references(document, article)
+                if cited :
+                    edges[article] = cited
+        return cls(edges, ids)
+
+    @classmethod
+    def load(cls, path:str) -> "ReferenceGraph":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["edges"], data["ids"])
+
+    def save(self, path:str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"edges": self._edges, "ids": self._ids}, f, ensure_ascii=False)
+
+    def expand(self, scored_docs:list[tuple[Document, float]], vector_store:Chroma, *, token_budget:int,
+               allowed:set[str]|None = None) -> list[tuple[Document, float]]:
+        """
+        Ajoute aux résultats (triés par pertinence) les articles qu'ils citent,
+        à un saut, tant que le budget de tokens n'est pas dépassé. Les articles
+        cités sont récupérés directement par leur id.
+        allowed : si précisé, seuls ces articles peuvent être ajoutés (portée de la recherche)
+        """
+        present = {doc.metadata.get("article_numero") for doc, _ in scored_docs}
+
+        # 1 - Choix des articles à ajouter, par ordre de pertinence de l'article qui les cite
+        to_add : list[str] = []
+        for doc, _ in sorted(scored_docs, key=lambda doc_score: doc_score[1], reverse=True):
+            for cited in self.neighbours(doc.metadata.get("article_numero")):
+                if cited not in present and cited not in to_add and (allowed is None or cited in allowed) :
+                    to_add.append(cited)
+        if not to_add :
+            return scored_docs
+        min_score = min(score for _, score in scored_docs)
+
+        # 2 - Récupération par id et respect du budget
+        expanded = list(scored_docs)
+        used = 0
+        documents = {doc.metadata.get("article_numero"): doc for doc in vector_store.get_by_ids([self._ids[cited] for cited in to_add])}
+        for rank, cited in enumerate(to_add, start=1):
+            doc = documents.get(cited)
+            if doc is None :
+                continue
+            cost = estimate_tokens(doc.page_content)
+            if used + cost > token_budget :
+                continue
+            expanded.append((doc, min_score - rank * REFERENCE_SCORE_STEP))
+            used += cost
+        return expanded
@@ -0,0 +1,179 @@
+# -*- coding: utf8 -*-
+#
+# Re-classement des chunks après la recherche vectorielle : on récupère plus
+# de candidats que nécessaire (sur-échantillonnage), on les note avec un
+# "scorer", et seuls les meilleurs vont dans le prompt. Scorers disponibles :
+#   - "lexical" (par défaut, local, sans requête API) : mots de la question
+#     présents dans l'article et son en-tête, article cité dans la question,
+#   - "llm" : note de pertinence donnée par un LLM (une requête par candidat),
+#   - "cross-encoder" : modèle cross-encoder local (package sentence-transformers).
+# Les notes sont calculées en parallèle et gardées en cache par (question, article).
+
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from mytools import normalize_question
+from chunker import extract_references
+from context_builder import hierarchy_header
+from provider import get_provider, get_llm
+
+# Mots trop fréquents pour distinguer deux articles
+STOPWORDS = set("""au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me même mes moi mon ne
+nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous est sont été être
+avoir a ont peut peuvent fait faire quel quelle quels quelles quoi comment combien est-ce article articles code pénal""".split())
+
+# Longueur des racines comparées (racinisation grossière : "condamné", "condamnation" -> "condamn")
+STEM_LENGTH = 7
+
+LLM_SCORE_PROMPT = ("Note de 0 à 10 la pertinence de l'extrait du code pénal suivant pour répondre à la question. "+
+                    "Réponds uniquement par la note entre les balises <note> et <fin_note>, par exemple <note>5<fin_note>.\n\n"+
+                    "**Question** :\n{question}\n\n**Extrait** :\n{text}\n")
+
+
+def stems(text:str) -> set[str]:
+    """Racines des mots significatifs d'un texte (minuscules, sans accents ni mots vides)"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return {word[:STEM_LENGTH] for word in re.findall(r"\w+", text) if len(word) > 2 and word not in STOPWORDS}
+
+
+class Scorer :
+    """Note la pertinence d'un chunk pour une question, entre 0 et 1"""
+
+    name = "base"
+    parallel = False # Vrai si noter plusieurs chunks en parallèle (threads) accélère le calcul
+
+    def score(self, query:str, doc:Document) -> float:
+        raise NotImplementedError
+
+    def score_batch(self, query:str, docs:list[Document]) -> list[float]:
+        return [self.score(query, doc) for doc in docs]
+
+
+class LexicalScorer(Scorer) :
+    """Part des mots de la question présents dans l'article (texte et en-tête hiérarchique), bonus si la question cite l'article"""
+
+    name = "lexical"
+
+    def score(self, query:str, doc:Document) -> float:
+        query_stems = stems(query)
+        cited = doc.metadata.get("article_numero") in extract_references(query)
+        if not query_stems :
+            return 1.0 if cited else 0.0
+        doc_stems = stems(doc.page_content + " " + hierarchy_header(doc.metadata))
+        coverage = len(query_stems & doc_stems) / len(query_stems)
+        return min(1.0, coverage + (0.5 if cited else 0.0))
+
+
+class LLMScorer(Scorer) :
+    """Note de pertinence donnée par un LLM (une requête API par chunk, passée par le client du fournisseur)"""
+
+    name = "llm"
+    parallel = True
+
+    def __init__(self, llm_model:str = "gemini-2.5-flash-lite") -> None:
+        self._llm = get_llm(llm_model, temperature=0.0)
+
+    def score(self, query:str, doc:Document) -> float:
+        reponse = get_provider().call(self._llm.invoke, LLM_SCORE_PROMPT.format(question=query, text=doc.page_content))
+        match = re.search(r"<note>(\d+)<fin_note>", reponse)
+        return min(10, int(match.group(1))) / 10 if match else 0.0
+
+
+class CrossEncoderScorer(Scorer) :
+    """Cross-encoder local (sentence-transformers), qui lit la question et le chunk ensemble"""
+
+    name = "cross-encoder"
+    parallel = True
+
+    def __init__(self, model_name:str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1") -> None:
+        try :
+            from sentence_transformers import CrossEncoder
+        except ImportError :
+            raise ImportError("Le scorer 'cross-encoder' nécessite le package sentence-transformers (uv add sentence-transformers)")
+        self._model = CrossEncoder(model_name)
+
+    def score(self, query:str, doc:Document) -> float:
+        return self.score_batch(query, [doc])[0]
+
+    def score_batch(self, query:str, docs:list[Document]) -> list[float]:
+        logits = self._model.predict([(query, doc.page_content) for doc in docs])
+        return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+
+
+# Scorers disponibles (paramètre rerank de l'expert)
+SCORERS = {"lexical": LexicalScorer, "llm": LLMScorer, "cross-encoder": CrossEncoderScorer}
+
+
+class Reranker :
+    """
+    Re-classe des chunks (déjà notés par la recherche vectorielle) en mélangeant
+    leur score de pertinence vectoriel et la note du scorer.
+    """
+
+    def __init__(self, scorer:Scorer, *, weight:float = 0.5, max_workers:int = 8, batch_size:int = 4, cache_size:int = 10_000) -> None:
+        """
+        Args:
+            scorer: scorer utilisé pour noter chaque chunk
+            weight: poids du score vectoriel dans le score final (1 - weight pour le scorer)
+            max_workers: nombre de threads pour noter les chunks (scorers parallèles)
+            batch_size: nombre de chunks notés par tâche
+            cache_size: nombre de notes (question, article) gardées en cache
+        """
+        self._scorer = scorer
+        self._weight = weight
+        self._batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if scorer.parallel else None
+        self._cache : OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.stats = {"scored": 0, "cached": 0}
+
+    @classmethod
+    def from_name(cls, name:str, **kwargs) -> "Reranker":
+        if name not in SCORERS :
+            raise ValueError(f"Scorer inconnu : '{name}' (possibles : {', '.join(SCORERS)})")
+        return cls(SCORERS[name](), **kwargs)
+
+    def rerank(self, query:str, scored_docs:list[tuple[Document, float]], k:int) -> list[tuple[Document, float]]:
+        """Renvoie les k meilleurs chunks selon le score final, du plus au moins pertinent"""
+        notes = self._notes(query, [doc for doc, _ in scored_docs])
+        reranked = [(doc, self._weight * score + (1 - self._weight) * note) for (doc, score), note in zip(scored_docs, notes)]
+        reranked.sort(key=lambda item: item[1], reverse=True)
+        return reranked[:k]
+
+    def _notes(self, query:str, docs:list[Document]) -> list[float]:
+        """Notes du scorer pour chaque chunk (cache d'abord, puis calcul des manquantes)"""
+        query_key = normalize_question(query)
+        keys = [(query_key, doc.id or doc.metadata.get("article_numero") or doc.page_content) for doc in docs]
+        with self._lock :
+            notes = [self._cache.get(key) for key in keys]
+            missing = [i for i, note in enumerate(notes) if note is None]
+            self.stats["cached"] += len(docs) - len(missing)
+        if not missing :
+            return notes
+
+        batches = [missing[i:i + self._batch_size] for i in range(0, len(missing), self._batch_size)]
+        score_batch = lambda batch: self._scorer.score_batch(query, [docs[i] for i in batch])
+        if self._executor is None or len(batches) == 1 :
+            results = map(score_batch, batches)
+        else :
+            results = self._executor.map(score_batch, batches)
+        for batch, batch_notes in zip(batches, results) :
+            for i, note in zip(batch, batch_notes) :
+                notes[i] = note
+
+        with self._lock :
+            self.stats["scored"] += len(missing)
+            for i in missing :
+                self._cache[keys[i]] = notes[i]
+                self._cache.move_to_end(keys[i])
+            while len(self._cache) > self._cache_size :
+                self._cache.popitem(last=False)
+        return notes
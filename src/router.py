@@ -0,0 +1,157 @@
+# -*- coding: utf8 -*-
+#
+# Routage des questions en cascade, du moins cher au plus cher :
+#   - "template" : demande du texte d'un article précis -> on renvoie le texte
+#     de l'article directement, sans LLM,
+#   - "cheap" : le LLM de l'expert (par défaut gemini-2.5-flash-lite),
+#   - "strong" : un modèle plus fort, seulement si la réponse du précédent
+#     semble mauvaise (heuristique rapide, et éventuellement note de l'AIJudge).
+# Le coût estimé et la latence sont comptabilisés par étage.
+
+import re
+import threading
+import time
+
+from mytools import estimate_tokens
+from chunker import extract_references
+from context_builder import hierarchy_header, context_articles
+from aiexpertlawyer import AIExpertLawyer
+from aijudge import AIJudge
+from sessions import Session
+from metadata_index import Scope
+
+TIERS = ("template", "cheap", "strong")
+
+# Prix indicatifs en dollars par million de tokens (entrée, sortie), pour
+# estimer le coût de chaque étage (ordre de grandeur, à mettre à jour)
+MODEL_PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# Question qui demande le texte d'un article ("Que dit l'article 122-8 ?")
+LOOKUP_PATTERN = re.compile(r"\b(que dit|que dispose|que prévoit|contenu|texte|énonce|cite[rz]?|donne[- ]moi)\b", re.IGNORECASE)
+
+# Formulations d'un LLM qui ne sait pas répondre
+HEDGING_PATTERN = re.compile(r"je ne (sais|peux) pas|aucune information|pas d'information|ne permet(tent)? pas de|ne contien(nen)?t pas", re.IGNORECASE)
+
+# En dessous de cette longueur (en caractères), une réponse est jugée trop courte
+MIN_ANSWER_LENGTH = 80
+
+
+def is_article_lookup(question:str) -> str|None:
+    """Renvoie le numéro de l'article si la question demande simplement le texte d'un article"""
+    articles = extract_references(question)
+    if len(articles) == 1 and LOOKUP_PATTERN.search(question) :
+        return articles[0]
+    return None
+
+
+def looks_weak(answer:str, rag_data:str, *, require_citation:bool = False) -> bool:
+    """
+    Heuristique rapide : réponse trop courte ou qui botte en touche. Avec
+    require_citation, une réponse qui ne cite aucun article du contexte est
+    aussi jugée faible : beaucoup de bonnes réponses n'en citent pas (cf.
+    bench_router.py), d'où le choix laissé à l'appelant.
+    """
+    if len(answer.strip()) < MIN_ANSWER_LENGTH or HEDGING_PATTERN.search(answer) :
+        return True
+    if not require_citation :
+        return False
+    articles = set(context_articles(rag_data))
+    return bool(articles) and not (set(extract_references(answer)) & articles)
+
+
+class ModelRouter :
+    """Répond aux questions en passant par l'étage le moins cher qui suffit"""
+
+    def __init__(self, *, strong_llm_model:str = "gemini-2.5-flash", judge:AIJudge|None = None, min_judge_note:int = 6,
+                 require_citation:bool = False) -> None:
+        """
+        Args:
+            strong_llm_model: modèle utilisé pour l'étage "strong"
+            judge: si précisé, les réponses de l'étage "cheap" qui passent
+                l'heuristique sont aussi notées par ce juge (une requête de plus)
+            min_judge_note: note minimale (sur 10) pour ne pas escalader
+            require_citation: escalader aussi les réponses qui ne citent aucun
+                article du contexte (cf. looks_weak)
+        """
+        self._strong_llm_model = strong_llm_model
+        self._require_citation = require_citation
+        self._judge = judge
+        self._min_judge_note = min_judge_note
+        self._lock = threading.Lock()
+        self._stats = {tier: {"count": 0, "latency_s": 0.0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0} for tier in TIERS}
+
+    def route(self, expert:AIExpertLawyer, question:str, session:Session|None = None, scope:Scope|None = None) -> tuple[str, str]:
+        """Renvoie la réponse et l'étage qui l'a produite"""
+        answer, tier = self._route(expert, question, session, scope)
+        if session is not None :
+            session.add_turn(question, answer)
+        return answer, tier
+
+    def _route(self, expert:AIExpertLawyer, question:str, session:Session|None, scope:Scope|None) -> tuple[str, str]:
+        start = time.perf_counter()
+
+        # 1 - Étage "template" : texte d'un article, sans LLM
+        numero = is_article_lookup(question)
+        if numero is not None :
+            article = expert.get_article(numero)
+            if article is not None :
+                answer = self._render_article(numero, article.page_content, article.metadata)
+                self._account("template", start)
+                return answer, "template"
+
+        # 2 - Étage "cheap" : le LLM de l'expert
+        rag_data = expert.build_context(question, session, scope)
+        prompt = expert.build_prompt(question, rag_data, session)
+        answer = expert.generate(prompt)
+        self._account("cheap", start, expert.get_llm_model(), prompt, answer)
+        if not self._needs_escalation(question, answer, rag_data) :
+            return answer, "cheap"
+
+        # 3 - Étage "strong" : même prompt, modèle plus fort
+        start = time.perf_counter()
+        answer = expert.generate(prompt, llm_model=self._strong_llm_model)
+        self._account("strong", start, self._strong_llm_model, prompt, answer)
+        return answer, "strong"
+
+    def ask(self, expert:AIExpertLawyer, question:str, session:Session|None = None, scope:Scope|None = None) -> str:
+        return self.route(expert, question, session, scope)[0]
+
+    def report(self) -> dict:
+        """Nombre de réponses, latence moyenne et coût estimé par étage"""
+        with self._lock :
+            return {
+                tier: {**stats, "mean_latency_s": stats["latency_s"] / stats["count"] if stats["count"] else 0.0}
+                for tier, stats in self._stats.items()
+            }
+
+    def _needs_escalation(self, question:str, answer:str, rag_data:str) -> bool:
+        if looks_weak(answer, rag_data, require_citation=self._require_citation) :
+            return True
+        if self._judge is None :
+            return False
+        note = self._judge.score_answer(question, answer, rag_data)
+        return note is not None and note < self._min_judge_note
+
+    def _account(self, tier:str, start:float, llm_model:str|None = None, prompt:str = "", answer:str = "") -> None:
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(answer)
+        price_in, price_out = MODEL_PRICES.get(llm_model, (0.0, 0.0))
+        with self._lock :
+            stats = self._stats[tier]
+            stats["count"] += 1
+            stats["latency_s"] += time.perf_counter() - start
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += (input_tokens * price_in + output_tokens * price_out) / 1e6
+
+    @staticmethod
+    def _render_article(numero:str, text:str, metadata:dict) -> str:
+        text = text.strip()
+        if text.startswith(numero) :
+            text = text[len(numero):].lstrip()
+        header = hierarchy_header(metadata)
+        return (f"**Article {numero} du code pénal** :\n\n> " + text.replace("\n", "\n> ") +
+                (f"\n\n*{header}*" if header else ""))
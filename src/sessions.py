@@ -0,0 +1,146 @@
+# -*- coding: utf8 -*-
+#
+# Sessions de conversation : chaque session garde les derniers chunks
+# récupérés (réutilisés tant que les questions suivantes restent proches) et
+# un historique borné des échanges (les plus anciens sont résumés en une ligne).
+# Les sessions sont stockées dans un cache LRU borné en nombre et en mémoire.
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Similarité cosinus minimale entre une question et la question qui a servi à
+# la dernière recherche pour réutiliser les chunks de cette recherche
+REUSE_THRESHOLD = 0.8
+
+# Une question d'au plus ce nombre de mots est une relance ("et pour un mineur ?") :
+# on la complète avec la question précédente pour la recherche
+FOLLOW_UP_MAX_WORDS = 6
+
+# Nombre d'échanges gardés dans l'historique (les précédents sont résumés), et
+# longueur maximale (caractères) d'une réponse gardée dans l'historique
+MAX_TURNS = 3
+TURN_ANSWER_MAX_LENGTH = 1500
+
+# Longueur maximale (caractères) d'une ligne de résumé et du résumé complet
+SUMMARY_LINE_LENGTH = 200
+SUMMARY_MAX_LENGTH = 1500
+
+
+class Session :
+    """Une conversation : derniers chunks récupérés et historique borné"""
+
+    def __init__(self, session_id:str) -> None:
+        self.session_id = session_id
+        self.last_access = time.time()
+        self.lock = threading.Lock() # Une seule question à la fois par session
+        self.turns : list[tuple[str, str]] = []
+        self.summary = ""
+        # Dernière recherche : question, vecteur de la question, résultats et notes de chapitres
+        self.retrieval_query : str|None = None
+        self.retrieval_vector : np.ndarray|None = None
+        self.retrieval_scope : dict|None = None
+        self.retrieval_results : list[tuple[Document, float]] = []
+        self.chapter_notes : dict[str, str] = {}
+        self.nb_reused = 0
+
+    def can_reuse(self, vector:list[float], scope:dict|None = None) -> bool:
+        """Vrai si les chunks de la dernière recherche conviennent encore pour une question de vecteur vector (et de même portée)"""
+        if self.retrieval_vector is None or scope != self.retrieval_scope :
+            return False
+        vector = np.asarray(vector, dtype=np.float32)
+        similarity = float(vector @ self.retrieval_vector) / ((np.linalg.norm(vector) * np.linalg.norm(self.retrieval_vector)) or 1.0)
+        return similarity >= REUSE_THRESHOLD
+
+    def retrieval_query_for(self, question:str) -> str:
+        """Requête à utiliser pour la recherche : une relance courte est complétée par la question précédente"""
+        if self.turns and len(question.split()) <= FOLLOW_UP_MAX_WORDS :
+            return f"{self.turns[-1][0]} {question}"
+        return question
+
+    def remember_retrieval(self, query:str, vector:list[float]|None, results:list[tuple[Document, float]], chapter_notes:dict[str, str],
+                           scope:dict|None = None) -> None:
+        self.retrieval_query = query
+        self.retrieval_scope = scope
+        self.retrieval_vector = None if vector is None else np.asarray(vector, dtype=np.float32)
+        self.retrieval_results = results
+        self.chapter_notes = chapter_notes
+
+    def add_turn(self, question:str, answer:str) -> None:
+        """Ajoute un échange à l'historique (en résumant les plus anciens)"""
+        self.turns.append((question, answer[:TURN_ANSWER_MAX_LENGTH]))
+        while len(self.turns) > MAX_TURNS :
+            old_question, old_answer = self.turns.pop(0)
+            first_sentence = re.split(r"(?<=[.!?])\s", old_answer.strip(), maxsplit=1)[0]
+            self.summary += f"- {old_question} -> {first_sentence}"[:SUMMARY_LINE_LENGTH] + "\n"
+            self.summary = self.summary[-SUMMARY_MAX_LENGTH:]
+
+    def history(self) -> str:
+        """Historique de la conversation à mettre dans le prompt (vide pour une nouvelle session)"""
+        if not self.turns and not self.summary :
+            return ""
+        lines = []
+        if self.summary :
+            lines.append("Résumé des échanges précédents :\n" + self.summary.rstrip())
+        for question, answer in self.turns :
+            lines.append(f"Question : {question}\nRéponse : {answer}")
+        return "\n\n".join(lines)
+
+    def nbytes(self) -> int:
+        """Estimation de la mémoire occupée par la session"""
+        size = len(self.summary) + sum(len(question) + len(answer) for question, answer in self.turns)
+        size += sum(len(doc.page_content) + len(str(doc.metadata)) for doc, _ in self.retrieval_results)
+        if self.retrieval_vector is not None :
+            size += self.retrieval_vector.nbytes
+        return size
+
+
+class SessionStore :
+    """Cache LRU de sessions, borné en nombre de sessions et en mémoire (estimée)"""
+
+    def __init__(self, *, max_sessions:int = 1000, max_bytes:int = 50_000_000) -> None:
+        self._sessions : OrderedDict[str, Session] = OrderedDict()
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_or_create(self, session_id:str|None) -> Session:
+        """Renvoie la session demandée, ou une nouvelle session si elle n'existe pas (ou plus)"""
+        with self._lock :
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None :
+                session = Session(session_id or uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            session.last_access = time.time()
+            self._evict()
+            return session
+
+    def get(self, session_id:str|None) -> Session|None:
+        """Renvoie la session demandée si elle existe (sans en créer ni la marquer comme utilisée)"""
+        with self._lock :
+            return self._sessions.get(session_id) if session_id else None
+
+    def touch(self) -> None:
+        """À appeler quand des sessions ont grossi : évince les moins récemment utilisées si besoin"""
+        with self._lock :
+            self._evict()
+
+    def nbytes(self) -> int:
+        return sum(session.nbytes() for session in self._sessions.values())
+
+    def _evict(self) -> None:
+        while len(self._sessions) > self._max_sessions :
+            self._sessions.popitem(last=False)
+        total = self.nbytes()
+        while total > self._max_bytes and len(self._sessions) > 1 :
+            _, session = self._sessions.popitem(last=False)
+            total -= session.nbytes()
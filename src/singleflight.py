@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+#
+# Regroupement des requêtes identiques simultanées ("single flight") : si la
+# même question (avec les mêmes paramètres) arrive plusieurs fois pendant
+# qu'elle est en cours de traitement, on n'appelle l'expert qu'une fois et
+# toutes les requêtes reçoivent le même résultat (ou le même flux de tokens).
+
+import asyncio
+import contextlib
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Iterator
+
+# Marqueur de fin d'un itérateur (next(iterator, _DONE))
+_DONE = object()
+
+
+class SharedStream :
+    """
+    Flux de tokens produit une seule fois et relu par tous les abonnés : chaque
+    abonné reçoit tout le flux depuis le début, même s'il arrive en cours de route.
+    """
+
+    def __init__(self) -> None:
+        self._chunks : list[str] = []
+        self._done = False
+        self._error : BaseException|None = None
+        self._changed = asyncio.Condition()
+
+    async def produce(self, make_iterator:Callable[[], Iterator[str]], *,
+                      admit:Callable[[], AsyncContextManager]|None = None) -> None:
+        """
+        Consomme un itérateur bloquant (dans un thread) et diffuse ses éléments,
+        dans le contexte admit() s'il est précisé (gardé pendant tout le flux)
+        """
+        try :
+            async with (admit() if admit is not None else contextlib.nullcontext()) :
+                iterator = await asyncio.to_thread(make_iterator)
+                while True :
+                    chunk = await asyncio.to_thread(next, iterator, _DONE)
+                    if chunk is _DONE :
+                        break
+                    async with self._changed :
+                        self._chunks.append(chunk)
+                        self._changed.notify_all()
+        except Exception as e :
+            self._error = e
+        finally :
+            async with self._changed :
+                self._done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True :
+            async with self._changed :
+                await self._changed.wait_for(lambda: self._done or position < len(self._chunks))
+                chunks = self._chunks[position:]
+                done, error = self._done, self._error
+            for chunk in chunks :
+                yield chunk
+            position += len(chunks)
+            if done and position >= len(self._chunks) :
+                if error is not None :
+                    raise error
+                return
+
+
+class SingleFlight :
+    """Regroupe les calculs identiques en cours, identifiés par une clé"""
+
+    def __init__(self) -> None:
+        self._inflight : dict[str, asyncio.Task] = {}
+        self._streams : dict[str, SharedStream] = {}
+        self.nb_coalesced = 0 # Nombre de requêtes servies par un calcul déjà en cours
+
+    async def do(self, key:str, compute:Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Renvoie le résultat de compute(), en le partageant avec les appels de
+        même clé en cours. Le calcul est une tâche indépendante des appelants :
+        l'annulation de l'un d'eux n'annule pas le calcul pour les autres.
+        """
+        task = self._inflight.get(key)
+        if task is None :
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else :
+            self.nb_coalesced += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key:str, make_iterator:Callable[[], Iterator[str]], *,
+               admit:Callable[[], AsyncContextManager]|None = None) -> AsyncIterator[str]:
+        """
+        Comme do() mais pour un flux de tokens : make_iterator (bloquant) n'est
+        appelé qu'une fois et tous les appelants de même clé reçoivent le même flux.
+        admit (la file d'admission par ex.) n'est pris que par la production du
+        flux, pas par chacun des abonnés.
+        """
+        shared = self._streams.get(key)
+        if shared is None :
+            shared = SharedStream()
+            self._streams[key] = shared
+            task = asyncio.ensure_future(shared.produce(make_iterator, admit=admit))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else :
+            self.nb_coalesced += 1
+        return shared.subscribe()
@@ -0,0 +1,131 @@
+# -*- coding: utf8 -*-
+#
+# Versions (snapshots) immuables de la base de donnée (RAG) : l'ingestion
+# (fill_rag.py, publish_snapshot.py) copie la base qu'elle vient de construire
+# dans SNAPSHOTS_DIR/<version>/ puis fait pointer le fichier CURRENT sur cette
+# version. Une version publiée n'est plus jamais modifiée : le serveur peut
+# charger la nouvelle version pendant qu'il répond encore avec l'ancienne, puis
+# basculer de l'une à l'autre d'un coup (cf. /reload dans interface.py).
+#
+#   snapshots/
+#   ├── CURRENT                  # nom de la version en service
+#   ├── 20251020-031500/         # copie complète du dossier Chroma (+ index local, renvois, ...)
+#   │   └── manifest.json        # date, source et nombre de chunks par collection
+#   ├── 20251020-031500_local/   # index locaux de cette version, s'il y en a (cf. local_index.py)
+#   └── 20251021-031500/
+
+import datetime
+import json
+import os
+import shutil
+
+import chromadb
+
+from local_index import local_indexes_dir
+
+SNAPSHOTS_DIR = os.environ.get("SNAPSHOTS_DIR", "snapshots")
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def snapshot_path(version:str, snapshots_dir:str = SNAPSHOTS_DIR) -> str:
+    return os.path.join(snapshots_dir, version)
+
+
+def current_snapshot(snapshots_dir:str = SNAPSHOTS_DIR) -> str|None:
+    """Version en service (None s'il n'y en a pas encore)"""
+    path = os.path.join(snapshots_dir, CURRENT_FILE)
+    if not os.path.exists(path) :
+        return None
+    with open(path, "r", encoding="utf-8") as f :
+        version = f.read().strip()
+    return version if version and os.path.isdir(snapshot_path(version, snapshots_dir)) else None
+
+
+def list_snapshots(snapshots_dir:str = SNAPSHOTS_DIR) -> list[str]:
+    """Versions publiées, de la plus ancienne à la plus récente"""
+    if not os.path.isdir(snapshots_dir) :
+        return []
+    return sorted(name for name in os.listdir(snapshots_dir)
+                  if os.path.exists(os.path.join(snapshots_dir, name, MANIFEST_FILE)))
+
+
+def read_manifest(version:str, snapshots_dir:str = SNAPSHOTS_DIR) -> dict:
+    with open(os.path.join(snapshot_path(version, snapshots_dir), MANIFEST_FILE), "r", encoding="utf-8") as f :
+        return json.load(f)
+
+
+def set_current(version:str, snapshots_dir:str = SNAPSHOTS_DIR) -> None:
+    """Fait pointer CURRENT sur version (remplacement atomique du fichier)"""
+    if not os.path.isdir(snapshot_path(version, snapshots_dir)) :
+        raise ValueError(f"Version inconnue : '{version}' (possibles : {', '.join(list_snapshots(snapshots_dir))})")
+    tmp_path = os.path.join(snapshots_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f :
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(snapshots_dir, CURRENT_FILE))
+
+
+def publish_snapshot(db_path:str, *, snapshots_dir:str = SNAPSHOTS_DIR, version:str|None = None, make_current:bool = True) -> str:
+    """
+    Copie la base db_path (dossier Chroma complet, et ses index locaux s'il y en
+    a) dans une nouvelle version et la met en service si make_current. La copie
+    est faite dans un dossier temporaire renommé à la fin : une version visible
+    est toujours complète.
+
+    Returns:
+        Le nom de la version publiée (par défaut la date et l'heure).
+    """
+    if version is None :
+        version = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = snapshot_path(version, snapshots_dir)
+    if os.path.exists(path) :
+        raise ValueError(f"La version '{version}' existe déjà : une version publiée n'est jamais modifiée")
+
+    # 1 - Copie de la base dans un dossier temporaire
+    os.makedirs(snapshots_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.copytree(db_path, tmp_path)
+    has_local_indexes = os.path.isdir(local_indexes_dir(db_path))
+    if has_local_indexes :
+        shutil.rmtree(local_indexes_dir(tmp_path), ignore_errors=True)
+        shutil.copytree(local_indexes_dir(db_path), local_indexes_dir(tmp_path))
+
+    # 2 - Manifeste (lu dans la copie, pour décrire exactement ce qui est publié)
+    client = chromadb.PersistentClient(path=tmp_path)
+    collections = {}
+    for collection in client.list_collections() :
+        name = getattr(collection, "name", collection)
+        collections[name] = client.get_collection(name).count()
+    manifest = {
+        "version": version,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "source": os.path.abspath(db_path),
+        "collections": collections,
+        "local_indexes": has_local_indexes,
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f :
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # 3 - Publication (renommage atomique, les index locaux d'abord) puis mise en service
+    if has_local_indexes :
+        shutil.rmtree(local_indexes_dir(path), ignore_errors=True)
+        os.rename(local_indexes_dir(tmp_path), local_indexes_dir(path))
+    os.rename(tmp_path, path)
+    if make_current :
+        set_current(version, snapshots_dir)
+    return version
+
+
+def prune_snapshots(*, keep:int = 3, snapshots_dir:str = SNAPSHOTS_DIR, protected:tuple[str, ...] = ()) -> list[str]:
+    """Supprime les versions les plus anciennes (sauf les keep dernières, la version en service et protected), renvoie les versions supprimées"""
+    current = current_snapshot(snapshots_dir)
+    versions = list_snapshots(snapshots_dir)
+    removed = []
+    for version in versions[:max(0, len(versions) - keep)] :
+        if version == current or version in protected :
+            continue
+        shutil.rmtree(snapshot_path(version, snapshots_dir))
+        shutil.rmtree(local_indexes_dir(snapshot_path(version, snapshots_dir)), ignore_errors=True)
+        removed.append(version)
+    return removed
@@ -0,0 +1,34 @@
+# Création d'une copie d'une collection avec des vecteurs tronqués (Matryoshka)
+# à partir des vecteurs déjà stockés : aucune requête API, pas de ré-ingestion.
+# On peut ensuite tester l'expert avec
+# AIExpertLawyer(chroma_collection_name=...) (la dimension est lue dans la collection)
+from langchain_chroma import Chroma
+
+from mytools import iter_collection
+from embeddings import truncate, collection_metadata
+
+# Collection source (pleine dimension) et dimension cible
+collection_name = "code_penal"
+persist_directory = "./chroma_langchain_db"
+DIMENSION = 768
+
+source = Chroma(
+    collection_name=collection_name,
+    persist_directory=persist_directory,
+)
+target = Chroma(
+    collection_name=f"{collection_name}_d{DIMENSION}",
+    persist_directory=persist_directory,
+    collection_metadata=collection_metadata(DIMENSION),
+)
+
+count = 0
+for batch in iter_collection(source._collection, include=["documents", "metadatas", "embeddings"]):
+    target._collection.upsert(
+        ids=batch["ids"],
+        documents=batch["documents"],
+        metadatas=batch["metadatas"],
+        embeddings=[truncate(vector, DIMENSION) for vector in batch["embeddings"]],
+    )
+    count += len(batch["ids"])
+print(f"{count} vecteurs copiés dans '{collection_name}_d{DIMENSION}' (dimension {DIMENSION}).")